@@ -1,11 +1,32 @@
+import base64
+import binascii
 import enum
+import hashlib
+import struct
+from datetime import date
+from typing import Any, Dict
+from urllib.parse import urlencode
 
-from app.core import mutate
+from app.core import cache, mutate
 from bdantic import models
 from bdantic.types import ModelDirective
 from fastapi import Depends, HTTPException, Path, Query, Request
 
 
+class NotModified(Exception):
+    """Raised when the client already has the current response to a request.
+
+    Attributes:
+        etag: The entity tag of the current response.
+    """
+
+    etag: str
+
+    def __init__(self, etag: str):
+        super().__init__(etag)
+        self.etag = etag
+
+
 class DirectiveType(str, enum.Enum):
     """An enum of valid values when specifying a directive type."""
 
@@ -23,6 +44,31 @@ class DirectiveType(str, enum.Enum):
     transaction = "transaction"
 
 
+class Format(str, enum.Enum):
+    """An enum of valid values when specifying a response format."""
+
+    json = "json"
+    ndjson = "ndjson"
+
+
+# A tree of fields to select, mapping the name of each selected field to the
+# fields selected from its value, or to None for selecting the entire value
+Fields = Dict[str, Any]
+
+# The header holding the cursor for fetching the next page of results
+NEXT_CURSOR = "X-Next-Cursor"
+
+# Cursors pack the digest of the snapshot, a digest of the query and the
+# offset into the results
+_CURSOR = struct.Struct("<16s8sQ")
+
+# Query parameters which don't affect which results there are, so they may
+# change between pages
+_PAGING = {"cursor", "format", "limit"}
+
+# Methods whose responses are tagged for conditional requests
+_CONDITIONAL = {"GET", "HEAD"}
+
 # Map DirectveType to it's actual model type
 _TYPE_MAP: dict[DirectiveType, type[ModelDirective]] = {
     DirectiveType.balance: models.Balance,
@@ -53,13 +99,211 @@ async def authenticated(request: Request) -> None:
         raise HTTPException(status_code=403)
 
 
-async def get_beanfile(request: Request) -> models.BeancountFile:
+async def get_snapshot(request: Request) -> cache.Snapshot:
+    """Returns the current snapshot of the loaded ledger.
+
+    Returns:
+        The current `Snapshot` instance.
+    """
+    return request.app.state.cache.snapshot()
+
+
+async def get_beanfile(
+    snapshot: cache.Snapshot = Depends(get_snapshot),
+) -> models.BeancountFile:
     """Returns the loaded `BeancountFile` instance.
 
     Returns:
         The loaded `BeancountFile` instance.
     """
-    return await request.app.state.cache.beanfile()
+    return snapshot.beanfile
+
+
+async def get_etag(
+    request: Request, snapshot: cache.Snapshot = Depends(get_snapshot)
+) -> str | None:
+    """Returns the entity tag of the response to a read request.
+
+    The tag is derived from the digest of the snapshot along with the path
+    and query parameters of the request, normalized by sorting them, and its
+    `Accept` header, which selects the format of some responses. The tag is
+    stored in the request state, for adding it to the response.
+
+    Tags are weak, as responses may be served with different encodings. As
+    the digest only depends on the contents of the ledger, they change
+    whenever the contents change, but not when an unchanged ledger is
+    reloaded or loaded by another process.
+
+    Args:
+        request: The request being answered.
+        snapshot: The snapshot the request is answered from.
+
+    Raises:
+        NotModified: If the request carries an `If-None-Match` header which
+            matches the tag, so the response doesn't need to be built.
+
+    Returns:
+        The entity tag, or None if the request doesn't read anything.
+    """
+    if request.method not in _CONDITIONAL:
+        return None
+
+    query = urlencode(sorted(request.query_params.multi_items()))
+    accept = request.headers.get("accept", "")
+    h = hashlib.blake2b(snapshot.digest.encode(), digest_size=16)
+    h.update(f"{request.url.path}?{query}\n{accept}".encode())
+    etag = f'W/"{h.hexdigest()}"'
+    request.state.etag = etag
+
+    matches = request.headers.get("if-none-match")
+    if matches is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in matches.split(",")}
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            raise NotModified(etag)
+
+    return etag
+
+
+def get_format(
+    request: Request,
+    format: Format
+    | None = Query(
+        None,
+        description="The response format: json or ndjson (one item per line)",
+    ),
+) -> Format:
+    """Returns the format the response should be encoded in.
+
+    Unless requested explicitly, responses are encoded as NDJSON if the
+    request accepts `application/x-ndjson` and as JSON otherwise.
+
+    Args:
+        request: The request being answered.
+        format: The explicitly requested format, if any.
+
+    Returns:
+        The format to encode the response in.
+    """
+    if format is not None:
+        return format
+    elif "application/x-ndjson" in request.headers.get("accept", ""):
+        return Format.ndjson
+
+    return Format.json
+
+
+def encode_cursor(
+    request: Request, snapshot: cache.Snapshot, offset: int
+) -> str:
+    """Returns an opaque cursor for continuing results at the given offset.
+
+    Args:
+        request: The request the results were computed for.
+        snapshot: The snapshot the results were computed from.
+        offset: The offset into the results to continue from.
+
+    Returns:
+        The URL safe cursor.
+    """
+    digest = bytes.fromhex(snapshot.digest)
+    raw = _CURSOR.pack(digest, _query_digest(request), offset)
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def get_cursor(
+    request: Request,
+    cursor: str
+    | None = Query(
+        None,
+        description="Continues the results from the cursor returned in the "
+        f"{NEXT_CURSOR} header of the previous page",
+    ),
+    snapshot: cache.Snapshot = Depends(get_snapshot),
+) -> int:
+    """Returns the offset into the results a cursor continues from.
+
+    Cursors are only valid for the contents of the ledger and the query they
+    were issued for, as the results at an offset differ for any other. The
+    contents are identified by the digest of the snapshot, so cursors remain
+    valid when an unchanged ledger is reloaded or served by another process.
+
+    Args:
+        request: The request being answered.
+        cursor: The cursor returned with the previous page, if any.
+        snapshot: The snapshot the request is answered from.
+
+    Raises:
+        HTTPException: If the cursor is invalid or was issued for another
+            query, or if the ledger changed since it was issued.
+
+    Returns:
+        The offset to continue from.
+    """
+    if cursor is None:
+        return 0
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        digest, query, offset = _CURSOR.unpack(raw)
+    except (binascii.Error, ValueError, struct.error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if query != _query_digest(request):
+        raise HTTPException(
+            status_code=400, detail="The cursor was issued for another query"
+        )
+    elif digest != bytes.fromhex(snapshot.digest):
+        raise HTTPException(
+            status_code=410,
+            detail="The ledger changed since the cursor was issued, "
+            "restart from the first page",
+        )
+
+    return offset
+
+
+def get_fields(
+    fields: str
+    | None = Query(
+        None,
+        description="Comma separated fields to include in each result, "
+        "nested fields are separated by dots",
+        example="date,narration,postings.account,postings.units",
+    ),
+) -> Fields | None:
+    """Parses the fields to include in each result.
+
+    Args:
+        fields: The comma separated paths of the fields, if any.
+
+    Raises:
+        HTTPException: If a path contains an empty field name.
+
+    Returns:
+        The tree of fields to include, or None to include all fields.
+    """
+    if fields is None:
+        return None
+
+    tree: Fields = {}
+    for path in fields.split(","):
+        *parents, leaf = path.strip().split(".")
+        if not leaf or not all(parents):
+            raise HTTPException(
+                status_code=400, detail=f"Invalid field: {path}"
+            )
+
+        node = tree
+        for key in parents:
+            child = node.setdefault(key, {})
+            if child is None:
+                # The entire value of a parent is already included
+                break
+            node = child
+        else:
+            node[leaf] = None
+
+    return tree
 
 
 def get_directive_type(t: DirectiveType) -> type[ModelDirective]:
@@ -111,5 +355,49 @@ def get_directives_mutator(
         mutate.MutatePriority.filter,
         description="Which operation should happen first: filter or search",
     ),
+    start: date
+    | None = Query(
+        None,
+        description="Only include directives on or after this date",
+        example="2022-01-01",
+    ),
+    end: date
+    | None = Query(
+        None,
+        description="Only include directives before this date",
+        example="2022-02-01",
+    ),
+    search_mode: mutate.SearchMode = Query(
+        mutate.SearchMode.exact,
+        description="How to match the search: exact, ranked or fuzzy",
+    ),
+    limit: int
+    | None = Query(
+        None,
+        description="The maximum number of directives to return",
+        ge=1,
+    ),
+    offset: int = Depends(get_cursor),
 ) -> mutate.DirectivesMutator:
-    return mutate.DirectivesMutator(filter, search, priority)
+    return mutate.DirectivesMutator(
+        filter, search, priority, start, end, search_mode, limit, offset
+    )
+
+
+def _query_digest(request: Request) -> bytes:
+    """Returns a digest of the query a page of results is requested for.
+
+    Args:
+        request: The request for the page.
+
+    Returns:
+        An 8 byte digest of the path and the normalized query parameters,
+        excluding those which only select the page.
+    """
+    params = sorted(
+        (key, value)
+        for key, value in request.query_params.multi_items()
+        if key not in _PAGING
+    )
+    query = f"{request.url.path}?{urlencode(params)}"
+    return hashlib.blake2b(query.encode(), digest_size=8).digest()
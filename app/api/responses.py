@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import functools
+import gzip
+from typing import Any, Callable, Coroutine, Iterable, Iterator, Sequence
+
+import orjson
+from anyio import to_thread
+from app.api import deps
+from app.core import cache, mutate
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
+from starlette.types import Message, Receive, Scope, Send
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Documents the alternative NDJSON encoding of an endpoint in OpenAPI
+NDJSON: dict[int | str, dict[str, Any]] = {
+    200: {"content": {"application/x-ndjson": {}}}
+}
+
+# Streamed lines are sent in chunks of at least this many bytes
+_CHUNK_SIZE = 64 * 1024
+
+# Cached responses smaller than this many bytes are sent uncompressed
+_MIN_COMPRESS_SIZE = 500
+
+# Compresses cached responses, by content coding in order of preference.
+# Cached responses are only compressed once per snapshot, so the levels
+# favor smaller responses over compression speed.
+_COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    _COMPRESSORS["br"] = functools.partial(brotli.compress, quality=6)
+if zstandard is not None:
+    _COMPRESSORS["zstd"] = functools.partial(zstandard.compress, level=10)
+_COMPRESSORS["gzip"] = functools.partial(
+    gzip.compress, compresslevel=9, mtime=0
+)
+
+
+def encode(content: Any, fields: deps.Fields | None = None) -> bytes:
+    """Encodes response content the same way response models are encoded.
+
+    The content is converted using `jsonable_encoder` with `None` values
+    excluded and fields named by their alias, matching the configuration of
+    all endpoints, and then serialized using `orjson`.
+
+    If fields are given, only those fields of the content are converted and
+    encoded, see `project`.
+
+    Args:
+        content: The content to encode.
+        fields: The fields of the content to encode, if not all of them.
+
+    Returns:
+        The JSON encoded content.
+    """
+    if fields is not None:
+        content = project(content, fields)
+
+    content = jsonable_encoder(content, exclude_none=True, by_alias=True)
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ModelResponse(Response):
+    """A JSON response which encodes models without validating them again.
+
+    Endpoints declare a `response_model` which FastAPI uses for generating
+    the OpenAPI schema, but also for validating, and thereby copying, the
+    returned content before encoding it. Models owned by a snapshot were
+    validated when the ledger was loaded and are never modified, so endpoints
+    return them wrapped in this response instead. FastAPI passes responses
+    through as is, and the content is encoded the same way FastAPI would
+    encode it.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self, content: Any, fields: deps.Fields | None = None, **kwargs
+    ):
+        self.fields = fields
+        super().__init__(content, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return encode(content, self.fields)
+
+
+class ConditionalRoute(APIRoute):
+    """A route which answers conditional requests.
+
+    The entity tag of a request is determined by the `get_etag` dependency,
+    which the API router declares for all routes. If the client already has
+    the current response, the dependency raises `NotModified` before any
+    other dependencies are solved or the endpoint is run, and the route
+    answers with an empty `304 Not Modified` response. FastAPI's handling of
+    HTTP exceptions would include a body, which isn't allowed for this
+    status. Otherwise the tag is added to successful responses.
+    """
+
+    def get_route_handler(
+        self,
+    ) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def conditional_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except deps.NotModified as e:
+                return Response(status_code=304, headers={"ETag": e.etag})
+
+            etag = getattr(request.state, "etag", None)
+            if etag is not None and response.status_code == 200:
+                response.headers["ETag"] = etag
+
+            return response
+
+        return conditional_handler
+
+
+def project(content: Any, fields: deps.Fields) -> Any:
+    """Selects the given fields of the content.
+
+    Fields are selected from models, by their alias, and from dictionaries,
+    by their key. Lists are projected item by item, and the root of custom
+    root models is projected in place of the model. Fields which are missing
+    or `None` are left out, and only the selected fields of models are read,
+    so none of the other fields are ever encoded.
+
+    Args:
+        content: The content to project.
+        fields: The fields to select.
+
+    Returns:
+        The selected fields, with models replaced by dictionaries.
+    """
+    if isinstance(content, (list, tuple)):
+        return [project(item, fields) for item in content]
+    elif isinstance(content, BaseModel) and "__root__" in content.__fields__:
+        return project(getattr(content, "__root__"), fields)
+    elif isinstance(content, BaseModel):
+        names = _names(type(content))
+        values = {k: getattr(content, names[k]) for k in fields if k in names}
+    elif isinstance(content, dict):
+        values = {k: content[k] for k in fields if k in content}
+    else:
+        return content
+
+    return {
+        key: value if fields[key] is None else project(value, fields[key])
+        for key, value in values.items()
+        if value is not None
+    }
+
+
+def ndjson(
+    items: Iterable[Any], fields: deps.Fields | None = None
+) -> StreamingResponse:
+    """Returns a response streaming the given items as NDJSON.
+
+    Every item is encoded on its own line as it's being sent, so at most a
+    chunk of encoded lines is held in memory at a time rather than the entire
+    encoded response. Items are encoded the same way as `ModelResponse`
+    encodes its content.
+
+    Args:
+        items: The items to stream.
+        fields: The fields of each item to encode, if not all of them.
+
+    Returns:
+        A `StreamingResponse` with one encoded item per line.
+    """
+    return StreamingResponse(
+        _lines(items, fields), media_type="application/x-ndjson"
+    )
+
+
+async def cached(
+    request: Request, snapshot: cache.Snapshot, build: Callable[[], Any]
+) -> Response:
+    """Returns the response to a request, encoding it once per snapshot.
+
+    Requests without query parameters always yield the same response for the
+    same snapshot. Their responses are encoded once, in a worker thread, and
+    the encoded bytes are stored in the snapshot and served to subsequent
+    requests for the same path until the next reload replaces the snapshot.
+    Responses to requests with query parameters are encoded every time.
+
+    Cached responses are compressed in the best encoding the request accepts,
+    see `_negotiate`, unless they're smaller than `_MIN_COMPRESS_SIZE`. The
+    compressed bytes are stored in the snapshot as well, so each response is
+    compressed at most once per encoding and snapshot.
+
+    Args:
+        request: The request being answered.
+        snapshot: The snapshot the request is answered from.
+        build: Builds the content of the response.
+
+    Returns:
+        A `Response` with the encoded content.
+    """
+    if request.query_params:
+        return ModelResponse(build())
+
+    path = request.url.path
+    body = snapshot.responses.get((path, "identity"))
+    if body is None:
+        body = await to_thread.run_sync(lambda: encode(build()))
+        snapshot.responses[(path, "identity")] = body
+
+    if len(body) < _MIN_COMPRESS_SIZE:
+        return Response(body, media_type="application/json")
+
+    headers = {"Vary": "Accept-Encoding"}
+    coding = _negotiate(request)
+    if coding is not None:
+        encoded = snapshot.responses.get((path, coding))
+        if encoded is None:
+            encoded = await to_thread.run_sync(_COMPRESSORS[coding], body)
+            snapshot.responses[(path, coding)] = encoded
+        body = encoded
+        headers["Content-Encoding"] = coding
+
+    return Response(body, headers=headers, media_type="application/json")
+
+
+async def paginated(
+    request: Request,
+    snapshot: cache.Snapshot,
+    mutator: mutate.DirectivesMutator,
+    positions: Sequence[int] | None = None,
+    format: deps.Format = deps.Format.json,
+    fields: deps.Fields | None = None,
+) -> Response:
+    """Returns the response to a request for a page of directives.
+
+    Requests without query parameters are answered from the cache, see
+    `cached`. Otherwise only the given fields of the page of directives
+    selected by the mutator are encoded, and the cursor for the next page, if
+    there is one, is returned in the `X-Next-Cursor` header.
+
+    Args:
+        request: The request being answered.
+        snapshot: The snapshot the request is answered from.
+        mutator: The mutator selecting the page of directives.
+        positions: The ascending positions of the directives to mutate, or
+            None to mutate all directives.
+        format: The format to encode the directives in.
+        fields: The fields of the directives to encode, if not all of them.
+
+    Returns:
+        A response with the encoded page of directives.
+    """
+    if format is deps.Format.json and not request.query_params:
+        return await cached(
+            request, snapshot, lambda: mutator.mutate(snapshot, positions)
+        )
+
+    page, after = mutator.page(snapshot, positions)
+    if format is deps.Format.ndjson:
+        response: Response = ndjson(page, fields)
+    else:
+        response = ModelResponse(page, fields)
+
+    if after is not None:
+        cursor = deps.encode_cursor(request, snapshot, after)
+        response.headers[deps.NEXT_CURSOR] = cursor
+
+    return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Compresses responses using gzip unless they're compressed already.
+
+    Cached responses are served precompressed, see `cached`, and are passed
+    through as is. Any other response is compressed like `GZipMiddleware`
+    does.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = _CompressionResponder(
+                    self.app, self.minimum_size, self.compresslevel
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder(GZipResponder):
+    """Compresses a response using gzip unless it's compressed already."""
+
+    passthrough = False
+
+    async def send_with_gzip(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers
+
+        if self.passthrough:
+            await self.send(message)
+        else:
+            await super().send_with_gzip(message)
+
+
+def _negotiate(request: Request) -> str | None:
+    """Selects the content coding to compress a response to a request with.
+
+    The codings accepted by the request's `Accept-Encoding` header are ranked
+    by their quality value. Ties are broken by the order of preference of the
+    available compressors.
+
+    Args:
+        request: The request being answered.
+
+    Returns:
+        The content coding to use, or None if the response shouldn't be
+        compressed.
+    """
+    accepted: dict[str, float] = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        name, _, value = params.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    default = accepted.get("*", 0.0)
+    ranked = [
+        (accepted.get(coding, default), -i, coding)
+        for i, coding in enumerate(_COMPRESSORS)
+    ]
+    quality, _, coding = max(ranked)
+
+    return coding if quality > 0 else None
+
+
+@functools.lru_cache(maxsize=None)
+def _names(model: type[BaseModel]) -> dict[str, str]:
+    """Maps the aliases of the fields of a model to their names.
+
+    Args:
+        model: The model type.
+
+    Returns:
+        A dictionary of field aliases to field names.
+    """
+    return {f.alias: name for name, f in model.__fields__.items()}
+
+
+def _lines(
+    items: Iterable[Any], fields: deps.Fields | None = None
+) -> Iterator[bytes]:
+    """Encodes items as lines and joins them into chunks.
+
+    Args:
+        items: The items to encode.
+        fields: The fields of each item to encode, if not all of them.
+
+    Yields:
+        Chunks of newline terminated encoded items.
+    """
+    chunk = bytearray()
+    for item in items:
+        chunk += encode(item, fields)
+        chunk += b"\n"
+        if len(chunk) >= _CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+
+    if chunk:
+        yield bytes(chunk)
@@ -1,11 +1,11 @@
-from typing import Dict, List, cast
+from typing import Dict, List
 
-from app.api import deps
-from app.core import mutate
+from app.api import deps, responses
+from app.core import cache, index, mutate
 from bdantic import models
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 
-router = APIRouter()
+router = APIRouter(route_class=responses.ConditionalRoute)
 
 
 @router.get(
@@ -17,9 +17,12 @@ router = APIRouter()
     response_model_by_alias=True,
 )
 async def accounts(
-    beanfile: models.BeancountFile = Depends(deps.get_beanfile),
-) -> dict[str, models.Account]:
-    return beanfile.accounts
+    request: Request,
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
+):
+    return await responses.cached(
+        request, snapshot, lambda: snapshot.beanfile.accounts
+    )
 
 
 @router.get(
@@ -32,8 +35,8 @@ async def accounts(
 )
 async def account(
     acct: models.Account = Depends(deps.get_account),
-) -> models.Account:
-    return acct
+) -> Response:
+    return responses.ModelResponse(acct)
 
 
 @router.get(
@@ -46,8 +49,8 @@ async def account(
 )
 async def balance(
     acct: models.Account = Depends(deps.get_account),
-) -> dict[str, models.Inventory]:
-    return acct.balance
+) -> Response:
+    return responses.ModelResponse(acct.balance)
 
 
 @router.get(
@@ -59,9 +62,17 @@ async def balance(
     response_model_by_alias=True,
 )
 async def transactions(
+    request: Request,
     acct: models.Account = Depends(deps.get_account),
-    beanfile: models.BeancountFile = Depends(deps.get_beanfile),
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
     mutator: mutate.DirectivesMutator = Depends(deps.get_directives_mutator),
-) -> list[models.Transaction]:
-    txns = beanfile.entries.by_account(acct.name).by_type(models.Transaction)
-    return cast(list[models.Transaction], mutator.mutate(txns).__root__)
+    fields: deps.Fields | None = Depends(deps.get_fields),
+) -> Response:
+    empty = index.positions()
+    txns = index.intersect(
+        snapshot.indexes.accounts.get(acct.name, empty),
+        snapshot.indexes.types.get(models.Transaction, empty),
+    )
+    return await responses.paginated(
+        request, snapshot, mutator, txns, fields=fields
+    )
@@ -1,7 +1,8 @@
+from app.api import deps
 from app.api.v1 import account, directive, file, query
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(deps.get_etag)])
 router.include_router(account.router, prefix="/account", tags=["account"])
 router.include_router(
     directive.router, prefix="/directive", tags=["directive"]
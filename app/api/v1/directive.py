@@ -1,12 +1,14 @@
-from app.api import deps
-from app.core import mutate
+from typing import List
+
+from app.api import deps, responses
+from app.core import cache, index, mutate
 from bdantic import models
 from bdantic.types import ModelDirective
-from fastapi import APIRouter, Depends, Path
+from fastapi import APIRouter, Body, Depends, Path, Request, Response
 from fastapi.exceptions import HTTPException
 from fastapi.responses import PlainTextResponse
 
-router = APIRouter()
+router = APIRouter(route_class=responses.ConditionalRoute)
 
 
 @router.get(
@@ -16,12 +18,18 @@ router = APIRouter()
     response_description="A list of all directives.",
     response_model_exclude_none=True,
     response_model_by_alias=True,
+    responses=responses.NDJSON,
 )
 async def directives(
-    beanfile: models.BeancountFile = Depends(deps.get_beanfile),
+    request: Request,
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
     mutator: mutate.DirectivesMutator = Depends(deps.get_directives_mutator),
-):
-    return mutator.mutate(beanfile.entries)
+    format: deps.Format = Depends(deps.get_format),
+    fields: deps.Fields | None = Depends(deps.get_fields),
+) -> Response:
+    return await responses.paginated(
+        request, snapshot, mutator, format=format, fields=fields
+    )
 
 
 @router.get(
@@ -31,17 +39,23 @@ async def directives(
     response_description="A list of all directives of the requested type.",
     response_model_exclude_none=True,
     response_model_by_alias=True,
+    responses=responses.NDJSON,
 )
 async def directive(
-    beanfile: models.BeancountFile = Depends(deps.get_beanfile),
+    request: Request,
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
     directive: deps.DirectiveType = Path(
         "", description="The type of directive to fetch"
     ),
     mutator: mutate.DirectivesMutator = Depends(deps.get_directives_mutator),
-):
+    format: deps.Format = Depends(deps.get_format),
+    fields: deps.Fields | None = Depends(deps.get_fields),
+) -> Response:
     typ = deps.get_directive_type(directive)
-    directives = beanfile.entries.by_type(typ)  # type: ignore
-    return mutator.mutate(directives)
+    positions = snapshot.indexes.types.get(typ, index.positions())
+    return await responses.paginated(
+        request, snapshot, mutator, positions, format, fields
+    )
 
 
 @router.get(
@@ -54,13 +68,38 @@ async def directive(
 )
 async def directive_id(
     id: str = Path("", description="The ID of the directive to fetch."),
-    beanfile: models.BeancountFile = Depends(deps.get_beanfile),
-) -> ModelDirective:
-    try:
-        return beanfile.entries.by_id(id)
-    except models.file.IDNotFoundError:
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
+) -> Response:
+    if id not in snapshot.indexes.ids:
         raise HTTPException(status_code=404, detail="Directive not found")
 
+    return responses.ModelResponse(
+        snapshot.beanfile.entries[snapshot.indexes.ids[id]]
+    )
+
+
+@router.post(
+    "/ids",
+    response_model=List[ModelDirective],  # type: ignore
+    summary="Fetches multiple directives by ID.",
+    response_description="The associated directives in the requested order.",
+    response_model_exclude_none=True,
+    response_model_by_alias=True,
+)
+async def directive_ids(
+    ids: List[str] = Body(..., description="The ID's of the directives."),
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
+) -> Response:
+    missing = [id for id in ids if id not in snapshot.indexes.ids]
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"Directives not found: {missing}"
+        )
+
+    return responses.ModelResponse(
+        snapshot.directives(snapshot.indexes.ids[id] for id in ids)
+    )
+
 
 @router.post(
     "/syntax",
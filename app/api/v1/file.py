@@ -1,10 +1,12 @@
+import itertools
 from typing import List
 
-from app.api import deps
+from app.api import deps, responses
+from app.core import cache
 from bdantic import models
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 
-router = APIRouter()
+router = APIRouter(route_class=responses.ConditionalRoute)
 
 
 @router.get(
@@ -14,11 +16,24 @@ router = APIRouter()
     response_description="A BeancountFile containing contents of the ledger.",
     response_model_exclude_none=True,
     response_model_by_alias=True,
+    responses=responses.NDJSON,
 )
 async def file(
-    beanfile: models.BeancountFile = Depends(deps.get_beanfile),
-) -> models.BeancountFile:
-    return beanfile
+    request: Request,
+    snapshot: cache.Snapshot = Depends(deps.get_snapshot),
+    format: deps.Format = Depends(deps.get_format),
+) -> Response:
+    beanfile = snapshot.beanfile
+    if format is deps.Format.ndjson:
+        # The file without its entries first, followed by one entry per line
+        rest = {
+            "options": beanfile.options,
+            "errors": beanfile.errors,
+            "accounts": beanfile.accounts,
+        }
+        return responses.ndjson(itertools.chain([rest], beanfile.entries))
+
+    return await responses.cached(request, snapshot, lambda: beanfile)
 
 
 @router.get(
@@ -45,5 +60,5 @@ async def errors(
 )
 async def options(
     beanfile: models.BeancountFile = Depends(deps.get_beanfile),
-) -> models.file.Options:
-    return beanfile.options
+) -> Response:
+    return responses.ModelResponse(beanfile.options)
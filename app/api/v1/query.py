@@ -1,8 +1,8 @@
-from app.api import deps
+from app.api import deps, responses
 from bdantic import models
 from fastapi import APIRouter, Depends, Query
 
-router = APIRouter()
+router = APIRouter(route_class=responses.ConditionalRoute)
 
 
 @router.get(
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
+from app.core.sources import Sources
 from bdantic import models
 from fastapi import Request
 
@@ -76,6 +77,103 @@ class BaseStorage:
         """
         pass
 
+    async def wait(self) -> None:
+        """Waits until the underlying storage has changed.
+
+        This is an event-driven alternative to polling `changed` which is used
+        when the cache is configured to watch for changes.
+
+        Raises:
+            NotImplementedError: If the provider doesn't support watching.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support watching for changes"
+        )
+
+    def source_files(self) -> Sources | None:
+        """Returns the local source files of the most recently loaded ledger.
+
+        Snapshots are only persisted to disk for providers where local files
+        are the source of truth for the ledger.
+
+        Returns:
+            The source files, or None if persisting is not supported.
+        """
+        return None
+
+    def restore(self, sources: Sources, bf: models.BeancountFile) -> bool:
+        """Restores the state of the provider from a persisted snapshot.
+
+        This is called in place of `load` when a snapshot which was persisted
+        to disk is still up to date with its source files.
+
+        Args:
+            sources: The source files of the persisted snapshot.
+            bf: The `BeancountFile` of the persisted snapshot.
+
+        Returns:
+            True if the snapshot can be used, False otherwise.
+        """
+        return False
+
+
+class BaseLoader:
+    """Base class for ledger loaders.
+
+    Loaders are responsible for parsing a ledger and converting it into a
+    `BeancountFile`. Storage providers hand the raw ledger over to the
+    configured loader rather than parsing it themselves, which allows the CPU
+    intensive parsing step to be moved off of the main process.
+
+    Attributes:
+        settings: An instance of `Settings` containing the configured settings.
+    """
+
+    settings: Settings
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+
+    def from_file(self, path: str) -> models.BeancountFile:
+        """Returns a new `BeancountFile` instance loaded from the given path.
+
+        Args:
+            path: The full path to the beancount ledger file.
+
+        Returns:
+            A `BeancountFile` instance with the loaded ledger contents.
+        """
+        pass
+
+    def from_string(self, contents: str) -> models.BeancountFile:
+        """Returns a new `BeancountFile` instance loaded from the contents.
+
+        Args:
+            contents: The raw contents of a beancount ledger.
+
+        Returns:
+            A `BeancountFile` instance with the loaded ledger contents.
+        """
+        pass
+
+    def share(self, bf: models.BeancountFile) -> models.BeancountFile:
+        """Shares the models of unchanged directives with the next load.
+
+        Loaded files are shared automatically, this is used to share the
+        models of a `BeancountFile` which wasn't loaded by this loader.
+
+        Args:
+            bf: The `BeancountFile` to share models of.
+
+        Returns:
+            The given `BeancountFile`.
+        """
+        return bf
+
+    def close(self) -> None:
+        """Releases any resources held by the loader."""
+        pass
+
 
 class ValidationError(Exception):
     """Raised when configured settings fail to validate."""
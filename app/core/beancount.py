@@ -1,19 +1,750 @@
+from __future__ import annotations
+
+import copy
+import glob
+import hashlib
+import io
+import math
+import multiprocessing
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Container, Iterable, Mapping, NamedTuple
 
 from bdantic import models
+from bdantic.models.realize import Account
+from bdantic.types import ModelDirective, type_map
+from pydantic import BaseModel
 
 from beancount import loader
+from beancount.core import data, realization
+from beancount.ops import validation  # type: ignore
+from beancount.parser import booking, parser  # type: ignore
+from beancount.utils import encryption  # type: ignore
+
+# Types whose representation never depends on the hash seed
+_ATOMIC = frozenset(
+    {type(None), bool, int, float, str, bytes, Decimal, date, datetime}
+)
+
+# The minimum number of entries per worker for converting in parallel
+_MIN_CHUNK = 1000
+
+
+class ParsedFile(NamedTuple):
+    """The result of parsing a single source file of a ledger.
+
+    Attributes:
+        digest: A digest of the file contents that were parsed.
+        entries: The unbooked entries parsed from the file.
+        errors: Any errors generated while parsing the file.
+        options_map: The options parsed from the file.
+    """
+
+    digest: str
+    entries: list[data.Directive]
+    errors: list[Any]
+    options_map: dict[str, Any]
+
+
+class DirectiveList(list):
+    """A list of directives along with the digests of their entries.
+
+    Attributes:
+        digests: The digest of the entry each directive was converted from,
+            see `digest`.
+    """
+
+    digests: list[bytes]
+
+    def __init__(self, dirs: Iterable = (), digests: Iterable[bytes] = ()):
+        super().__init__(dirs)
+        self.digests = list(digests)
+
+
+class LazyDirectives(DirectiveList):
+    """A list of directives which are converted into models on first access.
+
+    The list initially holds the raw beancount entries. Accessing an entry,
+    whether by index or by iterating, converts it into its model and stores
+    the model in place of the entry, so every entry is converted at most once
+    and only the entries which are actually used pay for the conversion.
+
+    Conversions aren't synchronized. Concurrent readers may both convert the
+    same entry, in which case one of the equal models is kept.
+
+    Attributes:
+        raw: The beancount entries the directives are converted from.
+    """
+
+    raw: list[data.Directive]
+
+    def __init__(
+        self,
+        entries: Iterable[data.Directive] = (),
+        digests: Iterable[bytes] = (),
+    ):
+        self.raw = list(entries)
+        super().__init__(self.raw, digests)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._materialize(index, super().__getitem__(index))
+
+    def __iter__(self):
+        for pos, entry in enumerate(super().__iter__()):
+            yield self._materialize(pos, entry)
+
+    def __reversed__(self):
+        for pos in reversed(range(len(self))):
+            yield self[pos]
+
+    def __contains__(self, value) -> bool:
+        return value in iter(self)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == other
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    def __add__(self, other) -> list:
+        return [*self, *other]
+
+    def __radd__(self, other) -> list:
+        return [*other, *self]
+
+    def __reduce__(self):
+        # Only the entries are pickled, models are converted again on demand
+        return type(self), (self.raw, self.digests)
+
+    def copy(self) -> list:
+        return list(self)
+
+    def count(self, value) -> int:
+        return list(self).count(value)
+
+    def index(self, value, *args) -> int:
+        return list(self).index(value, *args)
+
+    @property
+    def materialized(self) -> int:
+        """The number of directives which have been converted so far."""
+        return sum(type(e) not in type_map for e in super().__iter__())
+
+    def _materialize(self, pos: int, entry: Any) -> Any:
+        """Converts the entry at the given position if it's still raw.
+
+        Args:
+            pos: The position of the entry.
+            entry: The entry currently stored at the position.
+
+        Returns:
+            The model of the entry.
+        """
+        model_type = type_map.get(type(entry))
+        if model_type is None:
+            return entry
+
+        model = model_type.parse(entry)  # type: ignore
+        super().__setitem__(pos, model)
+        return model
+
+
+class ModelCache:
+    """Shares the models of unchanged directives between loads.
+
+    Models are keyed by a digest of the contents of the entry they were
+    converted from. Every load remembers the directives it produced, including
+    lazy directives converted after the load, and the next load reuses the
+    model of every entry whose digest it has seen before. Unchanged
+    directives are therefore the same objects in consecutive snapshots: only
+    one copy of them is held in memory during a reload, and anything cached
+    per directive carries over to the new snapshot.
+    """
+
+    def __init__(self):
+        self._previous = DirectiveList()
+
+    def known(self) -> dict[bytes, ModelDirective]:
+        """Returns the models of the previous load keyed by their digest.
+
+        Returns:
+            A dictionary of digests to models, excluding lazy directives which
+            haven't been converted.
+        """
+        previous = self._previous
+        return {
+            d: m
+            for d, m in zip(previous.digests, list.__iter__(previous))
+            if type(m) not in type_map
+        }
+
+    def convert(
+        self,
+        entries: list[data.Directive],
+        lazy: bool = False,
+        workers: int = 1,
+    ) -> DirectiveList:
+        """Converts entries into models, reusing the models of known entries.
+
+        Args:
+            entries: The entries to convert.
+            lazy: Whether to convert directives only when first accessed.
+            workers: The number of processes to convert directives with.
+
+        Returns:
+            The directives of the entries, in the same order.
+        """
+        digests = [digest(e) for e in entries]
+        if lazy:
+            return self.share(LazyDirectives(entries, digests))
+
+        known = self.known()
+        missing = [pos for pos, d in enumerate(digests) if d not in known]
+        converted = dict(
+            zip(missing, convert([entries[pos] for pos in missing], workers))
+        )
+
+        self._previous = DirectiveList(
+            [
+                known[d] if d in known else converted[pos]
+                for pos, d in enumerate(digests)
+            ],
+            digests,
+        )
+        return self._previous
+
+    def share(self, dirs: DirectiveList) -> DirectiveList:
+        """Replaces directives with the identical models of the previous load.
+
+        The given directives are remembered for the next load.
 
+        Args:
+            dirs: The directives to share models with, updated in place.
 
-def from_file(path: str) -> models.BeancountFile:
+        Returns:
+            The given directives.
+        """
+        known = self.known()
+        for pos, d in enumerate(dirs.digests):
+            model = known.get(d)
+            if model is not None:
+                list.__setitem__(dirs, pos, model)
+
+        self._previous = dirs
+        return dirs
+
+
+class IncrementalLoader:
+    """Loads ledgers from disk while reusing the work of previous loads.
+
+    Every source file of a ledger is parsed on its own and the result is cached
+    by a digest of the file contents. When loading again, only the files which
+    changed are parsed before booking, plugins and validation are run on the
+    merged stream of entries, the same way `beancount.loader` does. Likewise,
+    the models of entries which are identical to an entry from the previous
+    load are reused rather than converted again, see `ModelCache`.
+
+    Note that the cached entries are handed to plugins again on every load, so
+    plugins which mutate entries in-place rather than replacing them may not
+    behave as expected.
+    """
+
+    def __init__(self):
+        self._files: dict[str, ParsedFile] = {}
+        self._models = ModelCache()
+        self._top: str | None = None
+
+    def load(
+        self, path: str, lazy: bool = False, workers: int = 1
+    ) -> models.BeancountFile:
+        """Loads the ledger at the given path.
+
+        Args:
+            path: The full path to the beancount ledger file.
+            lazy: Whether to convert directives only when first accessed.
+            workers: The number of processes to convert directives with.
+
+        Returns:
+            A new instance of `BeancountFile` with the loaded ledger contents.
+        """
+        entries, errors, options_map = self._parse_recursive(path)
+        entries.sort(key=data.entry_sortkey)
+
+        # Booking mutates the metadata of entries in-place based on the
+        # options, which all come from the top level file. Models can only be
+        # compared against their entries if the options haven't changed.
+        top = self._files[os.path.normpath(path)].digest
+        if self._top is not None and self._top != top:
+            self._models = ModelCache()
+        self._top = top
+
+        entries, booking_errors = booking.book(entries, options_map)
+        errors.extend(booking_errors)
+
+        entries, errors = loader.run_transformations(
+            entries, errors, options_map, None
+        )
+        errors.extend(validation.validate(entries, options_map))
+        options_map["input_hash"] = loader.compute_input_hash(
+            options_map["include"]
+        )
+
+        return _construct(
+            self._models.convert(entries, lazy, workers),
+            entries,
+            errors,
+            options_map,
+        )
+
+    def share(self, dirs: DirectiveList, path: str) -> None:
+        """Shares the models of a ledger loaded elsewhere with the next load.
+
+        The ledger must have been loaded from the current contents of its
+        files, i.e. restored from a snapshot which is still up to date.
+
+        Args:
+            dirs: The directives of the ledger.
+            path: The full path to the beancount ledger file.
+        """
+        with open(path, "rb") as f:
+            self._top = hashlib.sha256(f.read()).hexdigest()
+        self._models.share(dirs)
+
+    def _parse_file(self, filename: str) -> ParsedFile:
+        """Parses a single source file, reusing the cached result if possible.
+
+        Args:
+            filename: The absolute path to the file.
+
+        Returns:
+            The result of parsing the file.
+        """
+        with open(filename, "rb") as f:
+            contents = f.read()
+
+        digest = hashlib.sha256(contents).hexdigest()
+        cached = self._files.get(filename)
+        if cached and cached.digest == digest:
+            return cached
+
+        if encryption.is_encrypted_file(filename):
+            contents = encryption.read_encrypted_file(filename).encode()
+
+        parsed = ParsedFile(
+            digest,
+            *parser.parse_file(io.BytesIO(contents), report_filename=filename),
+        )
+        self._files[filename] = parsed
+
+        return parsed
+
+    def _parse_recursive(
+        self, path: str
+    ) -> tuple[list[data.Directive], list[Any], dict[str, Any]]:
+        """Parses the given file and all of its includes.
+
+        This mirrors `beancount.loader._parse_recursive` for files on disk.
+
+        Args:
+            path: The full path to the beancount ledger file.
+
+        Returns:
+            A tuple of (entries, errors, options_map).
+        """
+        entries: list[data.Directive] = []
+        errors: list[Any] = []
+        options_map: dict[str, Any] | None = None
+
+        stack = [os.path.normpath(path)]
+        seen: set[str] = set()
+        while stack:
+            filename = stack.pop(0)
+            if filename in seen:
+                errors.append(
+                    _load_error(f'Duplicate filename parsed: "{filename}"')
+                )
+                continue
+            elif not os.path.exists(filename):
+                errors.append(_load_error(f'File "{filename}" does not exist'))
+                continue
+
+            seen.add(filename)
+            parsed = self._parse_file(filename)
+            entries.extend(parsed.entries)
+            errors.extend(parsed.errors)
+
+            # Options are copied as merging them mutates the top level map
+            if options_map is None:
+                options_map = copy.deepcopy(parsed.options_map)
+            else:
+                loader.aggregate_options_map(options_map, parsed.options_map)
+
+            cwd = glob.escape(os.path.dirname(filename))
+            for include in parsed.options_map["include"]:
+                matched = glob.glob(os.path.join(cwd, include), recursive=True)
+                if not matched:
+                    errors.append(
+                        _load_error(
+                            f'File glob "{include}" does not match any files'
+                        )
+                    )
+                stack.extend(os.path.normpath(m) for m in matched)
+
+        assert options_map is not None
+        options_map["include"] = sorted(seen)
+
+        return entries, errors, options_map
+
+
+# Loads are serialized by the cache, so a single instance per process suffices
+_incremental = IncrementalLoader()
+_shared = ModelCache()
+
+# Pools used for converting entries, keyed by their number of workers
+_pools: dict[int, ProcessPoolExecutor] = {}
+
+
+def from_file(
+    path: str, incremental: bool = False, lazy: bool = False, workers: int = 1
+) -> models.BeancountFile:
     """Creates a new `BeancountFile` instance using the file at the given path.
 
     Args:
         path: The full path to the beancount ledger file.
+        incremental: Whether to reuse the work of previous loads.
+        lazy: Whether to convert directives only when first accessed.
+        workers: The number of processes to convert directives with.
 
     Returns:
         A new instance of `BeancountFile` with the loaded ledger contents.
     """
     if not os.path.exists(path):
         raise FileNotFoundError(f"No ledger file located at {path}")
-    return models.BeancountFile.parse(loader.load_file(path))
+    elif incremental:
+        return _incremental.load(path, lazy, workers)
+    return _parse(loader.load_file(path), lazy, workers)
+
+
+def from_string(
+    contents: str, lazy: bool = False, workers: int = 1
+) -> models.BeancountFile:
+    """Creates a new `BeancountFile` instance using the given ledger contents.
+
+    Args:
+        contents: The raw contents of a beancount ledger.
+        lazy: Whether to convert directives only when first accessed.
+        workers: The number of processes to convert directives with.
+
+    Returns:
+        A new instance of `BeancountFile` with the loaded ledger contents.
+    """
+    return _parse(loader.load_string(contents), lazy, workers)
+
+
+def convert(
+    entries: list[data.Directive], workers: int = 1
+) -> list[ModelDirective]:
+    """Converts beancount entries into their models.
+
+    With more than one worker, the entries are split into one chunk per worker
+    which are converted in a pool of processes and reassembled in their
+    original order. Small lists aren't worth the overhead of shipping entries
+    and models between processes and are always converted in the calling
+    process.
+
+    Args:
+        entries: The entries to convert.
+        workers: The number of processes to convert the entries with.
+
+    Returns:
+        The models of the entries, in the same order.
+    """
+    chunks = min(workers, len(entries) // _MIN_CHUNK)
+    if chunks < 2:
+        return _convert_chunk(entries)
+
+    size = math.ceil(len(entries) / chunks)
+    bounds = [*range(0, len(entries), size), len(entries)]
+    parts = _converters(workers).map(
+        _convert_chunk,
+        [entries[lo:hi] for lo, hi in zip(bounds, bounds[1:])],
+    )
+
+    return [model for part in parts for model in part]
+
+
+def share(bf: models.BeancountFile) -> models.BeancountFile:
+    """Shares the models of the given `BeancountFile` with the next load.
+
+    Loads already share their models with the next load, this is only needed
+    for files which weren't loaded in this process (i.e. restored from disk).
+
+    Args:
+        bf: The `BeancountFile` to share models of.
+
+    Returns:
+        The given `BeancountFile`.
+    """
+    dirs = bf.entries.__root__
+    path = bf.options.filename
+    if isinstance(dirs, DirectiveList):
+        _shared.share(dirs)
+        if path and os.path.isfile(path):
+            _incremental.share(dirs, path)
+
+    return bf
+
+
+def shutdown() -> None:
+    """Shuts down the processes used for converting entries, if any."""
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.shutdown(cancel_futures=True)
+
+
+def digest(entry: data.Directive | ModelDirective) -> bytes:
+    """Returns a digest of the contents of the given entry.
+
+    Entries with the same digest convert into equal models. The digest is
+    computed over a canonical representation of the entry, see `_canonical`,
+    so it's the same in every process regardless of its hash seed.
+
+    Args:
+        entry: The beancount entry, or the model of one.
+
+    Returns:
+        A 16 byte digest.
+    """
+    canonical = _canonical(entry).encode()
+    return hashlib.blake2b(canonical, digest_size=16).digest()
+
+
+def _canonical(obj: Any) -> str:
+    """Returns a representation of an object which doesn't depend on hashing.
+
+    The iteration order of sets, like the tags and links of entries, depends
+    on the hash seed of the process, which makes their `repr` differ between
+    processes. Sets and the keys of dictionaries are sorted instead, while
+    any other object is represented by its `repr`.
+
+    Args:
+        obj: The object to represent.
+
+    Returns:
+        The canonical representation of the object.
+    """
+    if type(obj) in _ATOMIC:
+        return repr(obj)
+    elif isinstance(obj, tuple):
+        values = ",".join([_canonical(v) for v in obj])
+        return f"{type(obj).__name__}({values})"
+    elif isinstance(obj, list):
+        return "[" + ",".join([_canonical(v) for v in obj]) + "]"
+    elif isinstance(obj, dict):
+        items = [f"{_canonical(k)}:{_canonical(v)}" for k, v in obj.items()]
+        return "{" + ",".join(sorted(items)) + "}"
+    elif isinstance(obj, (set, frozenset)):
+        return "set{" + ",".join(sorted([_canonical(v) for v in obj])) + "}"
+    elif isinstance(obj, BaseModel):
+        return f"{type(obj).__name__}{_canonical(dict(obj))}"
+
+    return repr(obj)
+
+
+def directive_id(entry: data.Directive) -> str | None:
+    """Returns the ID bdantic assigns to the model of the given entry.
+
+    This allows identifying entries without converting them into models.
+
+    Args:
+        entry: The beancount entry.
+
+    Returns:
+        The ID of the entry, or None if it wasn't loaded from a file.
+    """
+    try:
+        key = "".join(
+            [
+                os.path.basename(entry.meta["filename"]),
+                str(entry.meta["lineno"]),
+                str(entry.date),
+            ]
+        )
+    except (KeyError, TypeError):
+        return None
+
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def dumps(
+    bf: models.BeancountFile, known: Container[bytes] = frozenset()
+) -> bytes:
+    """Serializes the given `BeancountFile` for transport between processes.
+
+    Directives whose digest is known to the receiving process are serialized
+    as a reference to their digest, since the receiver already holds an
+    identical model. `loads` substitutes the models back in.
+
+    Args:
+        bf: The `BeancountFile` to serialize.
+        known: The digests of the models held by the receiving process.
+
+    Returns:
+        The serialized `BeancountFile`.
+    """
+    dirs = bf.entries.__root__
+    if not known or not isinstance(dirs, DirectiveList):
+        return pickle.dumps(bf, protocol=pickle.HIGHEST_PROTOCOL)
+
+    shared = {
+        id(m): d
+        for d, m in zip(dirs.digests, list.__iter__(dirs))
+        if d in known and type(m) not in type_map
+    }
+
+    f = io.BytesIO()
+    _SharingPickler(f, shared).dump(bf)
+    return f.getvalue()
+
+
+def loads(
+    raw: bytes, known: Mapping[bytes, ModelDirective] | None = None
+) -> models.BeancountFile:
+    """Deserializes a `BeancountFile` previously serialized with `dumps`.
+
+    Args:
+        raw: The serialized `BeancountFile`.
+        known: The models whose digests were passed to `dumps`.
+
+    Returns:
+        The deserialized `BeancountFile`.
+    """
+    return _SharingUnpickler(io.BytesIO(raw), known or {}).load()
+
+
+class _SharingPickler(pickle.Pickler):
+    """Pickles shared objects as a reference to a key instead."""
+
+    def __init__(self, file: io.BytesIO, shared: dict[int, bytes]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._shared = shared
+
+    def persistent_id(self, obj: Any) -> bytes | None:
+        return self._shared.get(id(obj))
+
+
+class _SharingUnpickler(pickle.Unpickler):
+    """Unpickles references created by `_SharingPickler`."""
+
+    def __init__(self, file: io.BytesIO, shared: Mapping[bytes, Any]):
+        super().__init__(file)
+        self._shared = shared
+
+    def persistent_load(self, pid: bytes) -> Any:
+        return self._shared[pid]
+
+
+def _parse(
+    result: tuple[list[data.Directive], list[Any], dict[str, Any]],
+    lazy: bool,
+    workers: int,
+) -> models.BeancountFile:
+    """Converts the results of the beancount loader into a `BeancountFile`.
+
+    Args:
+        result: The entries, errors and options returned by the loader.
+        lazy: Whether to convert directives only when first accessed.
+        workers: The number of processes to convert directives with.
+
+    Returns:
+        A new instance of `BeancountFile`.
+    """
+    entries, errors, options_map = result
+    return _construct(
+        _shared.convert(entries, lazy, workers), entries, errors, options_map
+    )
+
+
+def _load_error(message: str) -> loader.LoadError:
+    """Creates an error like the ones raised by the beancount loader.
+
+    Args:
+        message: The error message.
+
+    Returns:
+        A new `LoadError` without an associated entry.
+    """
+    return loader.LoadError(  # type: ignore
+        data.new_metadata("<load>", 0), message, None
+    )
+
+
+def _converters(workers: int) -> ProcessPoolExecutor:
+    """Returns the pool used for converting entries, creating it if necessary.
+
+    Like `ProcessLoader`, the pool uses the `spawn` start method so that no
+    state is inherited from the calling process.
+
+    Args:
+        workers: The number of worker processes.
+
+    Returns:
+        The process pool with the given number of workers.
+    """
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    return _pools[workers]
+
+
+def _convert_chunk(entries: list[data.Directive]) -> list[ModelDirective]:
+    """Converts a chunk of entries into their models.
+
+    Args:
+        entries: The entries to convert.
+
+    Returns:
+        The models of the entries, in the same order.
+    """
+    return [type_map[type(e)].parse(e) for e in entries]  # type: ignore
+
+
+def _construct(
+    dirs: list[ModelDirective],
+    entries: list[data.Directive],
+    errors: list[Any],
+    options_map: dict[str, Any],
+) -> models.BeancountFile:
+    """Creates a `BeancountFile` from already converted directives.
+
+    Args:
+        dirs: The directive models.
+        entries: The entries the directive models were converted from.
+        errors: The errors generated while loading.
+        options_map: The options of the ledger.
+
+    Returns:
+        A new instance of `BeancountFile`.
+    """
+    real = realization.realize(entries)
+    accounts = {
+        e.account: Account.parse(realization.get(real, e.account))
+        for e in entries
+        if isinstance(e, data.Open)
+    }
+
+    # The models are already validated, skip validating them again
+    return models.BeancountFile.construct(
+        entries=models.Directives.construct(__root__=dirs),
+        options=models.file.Options.parse(options_map),
+        errors=errors,
+        accounts=accounts,
+    )
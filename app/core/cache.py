@@ -1,15 +1,253 @@
+from __future__ import annotations
+
 import asyncio
-from dataclasses import dataclass
+import functools
+import hashlib
+import json
+from dataclasses import InitVar, dataclass, field, fields
+from datetime import date
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Sequence, overload
 
-import cachetools
-from anyio import Lock
-from app.core import base
+from anyio import Lock, to_thread
+from app.core import base, beancount, index, persist, search
+from app.core.sources import Sources
 from bdantic import models
 from loguru import logger
 
 
+@dataclass(frozen=True, eq=False)
+class Snapshot:
+    """An immutable view of a loaded ledger.
+
+    A new snapshot is created every time the underlying storage is loaded and
+    is never modified afterwards. Requests hold on to the snapshot they were
+    given for their entire duration, which keeps their view of the ledger
+    consistent even if a reload swaps in a newer snapshot in the meantime.
+
+    Secondary indexes over the directives are built once when the snapshot
+    is created, which allows requests to look up directives without scanning
+    the entire ledger. Other derived data, like the plain view of the
+    directives used for JMESPath filtering or the full-text search index, is
+    built lazily on first use and then shared by all requests using the
+    snapshot, as are the encoded bodies of responses which don't depend on
+    any request parameters. Lazily built data is not included when the
+    snapshot is pickled.
+
+    Loaders share the models of unchanged directives between loads. The parts
+    of the previous snapshot's view which belong to such directives are
+    carried over and reused when the view of the new snapshot is built.
+
+    Attributes:
+        beanfile: The loaded `BeancountFile`.
+        generation: Incremented each time a new snapshot is loaded.
+        indexes: The secondary indexes over the loaded directives.
+        previous: The snapshot this snapshot replaces, if any.
+    """
+
+    beanfile: models.BeancountFile
+    generation: int = 0
+    indexes: index.Indexes = field(init=False)
+    previous: InitVar[Snapshot | None] = None
+
+    def __post_init__(self, previous: Snapshot | None):
+        object.__setattr__(
+            self, "indexes", index.Indexes(self.beanfile.entries)
+        )
+
+        # Only keep the parts of the previous view this snapshot can reuse
+        forms = {}
+        if previous is not None and "view" in previous.__dict__:
+            current = {id(e) for e in _stored(self.beanfile)}
+            forms = {
+                key: form
+                for key, form in previous.view.built()
+                if key in current
+            }
+        object.__setattr__(self, "_forms", forms)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {f.name: self.__dict__[f.name] for f in fields(self)}
+
+    @functools.cached_property
+    def view(self) -> View:
+        """A plain representation of each directive for JMESPath to query.
+
+        This is equivalent to the representation `Directives.select` builds
+        on every call: the result of `dict()` with decimals converted to
+        floats and dates converted to ISO formatted strings.
+
+        Returns:
+            A `View` in the same order as the directives.
+        """
+        return View(self.beanfile.entries, self.__dict__.pop("_forms", {}))
+
+    @functools.cached_property
+    def digest(self) -> str:
+        """A digest of the contents of the loaded ledger.
+
+        The digest covers the directives, options and errors of the ledger,
+        so snapshots loaded from the same contents have the same digest, even
+        across restarts. Directives are digested using the digests recorded
+        when their entries were loaded, if there are any.
+
+        Returns:
+            The hex encoded digest.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        digests = getattr(self.beanfile.entries.__root__, "digests", None)
+        if digests is None:
+            digests = map(beancount.digest, self.beanfile.entries)
+        for d in digests:
+            h.update(d)
+
+        for part in (self.beanfile.options.dict(), self.beanfile.errors):
+            h.update(
+                json.dumps(part, sort_keys=True, default=_canonical).encode()
+            )
+
+        return h.hexdigest()
+
+    @functools.cached_property
+    def responses(self) -> dict[tuple[str, str], bytes]:
+        """Encoded responses to requests which only depend on this snapshot.
+
+        Returns:
+            A dictionary of request paths and content codings to encoded, and
+            possibly compressed, response bodies.
+        """
+        return {}
+
+    @functools.cached_property
+    def searcher(self) -> search.DirectiveSearcher:
+        """A full-text searcher over all directives.
+
+        Returns:
+            A `DirectiveSearcher` whose index is shared by all requests.
+        """
+        return search.DirectiveSearcher(self.beanfile.entries)
+
+    def directives(self, positions: Iterable[int]) -> models.Directives:
+        """Returns the directives at the given positions.
+
+        Args:
+            positions: The positions of the directives in the ledger.
+
+        Returns:
+            A new instance of `Directives` containing the directives.
+        """
+        entries = self.beanfile.entries.__root__
+        return models.Directives.construct(
+            __root__=[entries[pos] for pos in positions]
+        )
+
+
+class View(Sequence[dict[str, Any]]):
+    """The plain view of a list of directives.
+
+    The plain representation of a directive is only built when it's first
+    accessed, so directives which are never filtered are never converted.
+
+    Args:
+        entries: The directives to build the view of.
+        forms: Already built representations to reuse, keyed by the `id()` of
+            the directive they belong to.
+    """
+
+    def __init__(
+        self, entries: models.Directives, forms: dict[int, dict[str, Any]]
+    ):
+        self._entries = entries.__root__
+        self._forms: list[dict[str, Any] | None] = [None] * len(self._entries)
+        self._reuse = forms
+
+    def __len__(self) -> int:
+        return len(self._forms)
+
+    @overload
+    def __getitem__(self, pos: int) -> dict[str, Any]:
+        ...
+
+    @overload
+    def __getitem__(self, pos: slice) -> list[dict[str, Any]]:
+        ...
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+
+        form = self._forms[pos]
+        if form is None:
+            entry = self._entries[pos]
+            form = self._reuse.get(id(entry))
+            if form is None:
+                form = _plain(entry.dict())
+            self._forms[pos] = form
+
+        return form
+
+    def built(self) -> Iterator[tuple[int, dict[str, Any]]]:
+        """Iterates over the representations which have been built so far.
+
+        Returns:
+            An iterator over the `id()` of each directive whose representation
+            has been built and its representation.
+        """
+        for pos, form in enumerate(self._forms):
+            if form is not None:
+                yield id(list.__getitem__(self._entries, pos)), form
+
+
+def _stored(bf: models.BeancountFile) -> Iterable[Any]:
+    """Iterates over the stored directives without converting lazy ones.
+
+    Args:
+        bf: The `BeancountFile` to iterate over.
+
+    Returns:
+        An iterator over the stored models and unconverted entries.
+    """
+    return list.__iter__(bf.entries.__root__)
+
+
+def _canonical(obj: Any) -> Any:
+    """Converts objects JSON can't encode into a stable representation.
+
+    Args:
+        obj: The object to convert.
+
+    Returns:
+        Sets as sorted lists, anything else as a string.
+    """
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+
+    return str(obj)
+
+
+def _plain(obj: Any) -> Any:
+    """Recursively converts an object into types supported by JMESPath.
+
+    Args:
+        obj: The object to convert.
+
+    Returns:
+        The converted object.
+    """
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, set, tuple)):
+        return [_plain(v) for v in obj]
+    elif isinstance(obj, Decimal):
+        return float(obj)
+    elif isinstance(obj, date):
+        return obj.isoformat()
+
+    return obj
+
+
 @dataclass
-class Cache(cachetools.Cache):
+class Cache:
     """A cache for storing a `BeancountFile`.
 
     This class provides global access to a cached instance of `BeancountFile`
@@ -17,44 +255,170 @@ class Cache(cachetools.Cache):
     run on startup and is responsible for invalidating request when the
     underlying storage changes.
 
+    The cached data is held in an immutable `Snapshot`. Reloads build a new
+    snapshot off to the side and then swap the reference in a single
+    assignment, so readers never need to acquire a lock and are never blocked
+    by a reload in progress. The lock only serializes concurrent reloads.
+
+    Storage providers are always invoked from a worker thread so that loading
+    a ledger never blocks the event loop.
+
     Attributes:
         interval: Frequency that the invalidator should check the storage.
+        lock: Held while a new snapshot is being loaded.
         storage: The underlying storage being used.
-
+        store: Where snapshots are persisted to for faster startups, if any.
+        watch: Whether to wait on storage events instead of polling.
     """
 
     interval: int
     lock: Lock
     storage: base.BaseStorage
-    _value: models.BeancountFile
+    store: persist.SnapshotStore | None
+    watch: bool
+    _persisting: Lock
+    _snapshot: Snapshot | None
 
-    def __init__(self, storage: base.BaseStorage, interval: int = 5):
-        super().__init__(50)
+    def __init__(
+        self,
+        storage: base.BaseStorage,
+        interval: int = 5,
+        watch: bool = False,
+        store: persist.SnapshotStore | None = None,
+    ):
         self.storage = storage
         self.interval = interval
+        self.watch = watch
+        self.store = store
         self.lock = Lock()
+        self._persisting = Lock()
+        self._snapshot = None
 
     async def beanfile(self) -> models.BeancountFile:
-        async with self.lock:
-            return self["beanfile"]
+        """Returns the `BeancountFile` from the current snapshot.
+
+        Returns:
+            The currently cached `BeancountFile`.
+        """
+        return self.snapshot().beanfile
+
+    def snapshot(self) -> Snapshot:
+        """Returns the current snapshot without acquiring any locks.
+
+        Raises:
+            LookupError: If the cache has not been loaded yet.
+
+        Returns:
+            The current snapshot.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise LookupError("The cache has not been loaded yet")
+
+        return snapshot
 
     async def load(self):
         logger.info("Loading cache data")
         async with self.lock:
-            self["beanfile"] = self.storage.load()
-        logger.info("Cache data successfully loaded")
+            generation = self._snapshot.generation if self._snapshot else 0
+            beanfile = await to_thread.run_sync(self.storage.load)
+            snapshot = await to_thread.run_sync(
+                Snapshot, beanfile, generation + 1, self._snapshot
+            )
+            self._snapshot = snapshot
+            sources = self.storage.source_files()
+        logger.info(f"Cache data successfully loaded (gen {generation + 1})")
+
+        if self.store and sources:
+            await self.save(snapshot, sources)
+
+    async def save(self, snapshot: Snapshot, sources: Sources):
+        """Persists the given snapshot unless a newer one was loaded since.
+
+        Snapshots are persisted without holding `lock`, so writing a large
+        snapshot to disk doesn't delay the next reload.
+
+        Args:
+            snapshot: The snapshot to persist.
+            sources: The source files the snapshot was loaded from.
+        """
+        if not self.store:
+            return
+
+        async with self._persisting:
+            if snapshot is not self._snapshot:
+                return
+
+            logger.info(f"Persisting cache data to {self.store.path}")
+            try:
+                await to_thread.run_sync(self.store.write, snapshot, sources)
+            except OSError as e:
+                logger.warning(f"Failed persisting cache data: {e}")
+
+    async def restore(self) -> bool:
+        """Restores the persisted snapshot, if there is an up to date one.
+
+        Returns:
+            True if a snapshot was restored, False otherwise.
+        """
+        if not self.store:
+            return False
+
+        async with self.lock:
+            try:
+                restored = await to_thread.run_sync(self.store.read)
+            except Exception as e:
+                logger.warning(f"Failed restoring cache data: {e}")
+                return False
+
+            if not restored:
+                return False
+
+            snapshot, sources = restored
+            if not self.storage.restore(sources, snapshot.beanfile):
+                return False
+
+            self._snapshot = snapshot
+        logger.info(f"Cache data restored from {self.store.path}")
+        return True
 
     async def background(self):
         """An async loop for managing the cache."""
         # Prime the cache
         logger.info("Priming cache")
-        await self.load()
+        if not await self.restore():
+            await self.load()
+
+        if self.watch:
+            logger.info("Watching storage for changes")
+            while True:
+                try:
+                    await self.storage.wait()
+                except (NotImplementedError, OSError) as e:
+                    logger.warning(
+                        f"Unable to watch storage, polling instead: {e}"
+                    )
+                    break
+
+                await self.reload()
 
         logger.info("Entering main cache loop")
         while True:
             # Check for state changes
-            if self.storage.changed(self["beanfile"]):
-                logger.info("Cache invalidated")
-                await self.load()
+            if self.storage.changed(self.snapshot().beanfile):
+                await self.reload()
 
             await asyncio.sleep(self.interval)
+
+    async def reload(self):
+        """Reloads the cache after the storage changed.
+
+        Failing to load the changed storage is logged rather than raised, so
+        the cache keeps serving the previous snapshot and watching for the
+        next change.
+        """
+        logger.info("Cache invalidated")
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Failed reloading cache data: {e}")
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from datetime import date
+from typing import Any, Iterable, Sequence
+
+from app.core.beancount import LazyDirectives, directive_id
+from bdantic import models
+from bdantic.types import ModelDirective, type_map
+
+from beancount.core import data
+
+# Below this size ratio, sequences are intersected with sets instead
+_GALLOP_RATIO = 16
+
+# Directives and entries which reference a single account through their
+# `account` field
+_SIMPLE = (
+    models.Open,
+    models.Close,
+    models.Balance,
+    models.Note,
+    models.Document,
+    data.Open,
+    data.Close,
+    data.Balance,
+    data.Note,
+    data.Document,
+)
+_TRANSACTION = (models.Transaction, data.Transaction)
+
+
+def positions(values: Iterable[int] = ()) -> array:
+    """Creates a new array for holding directive positions.
+
+    Args:
+        values: The initial positions.
+
+    Returns:
+        A new array of unsigned integers.
+    """
+    return array("I", values)
+
+
+class Indexes:
+    """Secondary indexes over the directives of a ledger.
+
+    Each index maps a key to the positions of the directives which match it.
+    Positions are indexes into the list of directives the indexes were built
+    from and are always stored in ascending order, so looking up a key yields
+    the matching directives in ledger order without scanning the ledger.
+
+    Directives are additionally indexed by date, which allows restricting
+    results to a date range by bisecting rather than comparing the date of
+    every directive. Ledgers loaded by beancount are already sorted by date,
+    in which case a date range maps to a contiguous range of positions.
+
+    Account matching follows `Directives.by_account`: transactions match the
+    accounts of their postings, pads match both of their accounts and custom
+    directives match any string value.
+
+    Directives which are converted lazily are indexed from their raw entries,
+    so building the indexes doesn't convert any of them.
+
+    Attributes:
+        accounts: Maps account names to the directives referencing them.
+        chronological: The positions of all directives ordered by date, or
+            None if the directives are already ordered by date.
+        dates: The dates of all directives in ascending order.
+        ids: Maps directive IDs to the position of the directive.
+        links: Maps links to the directives carrying them.
+        payees: Maps payees to the transactions with that payee.
+        tags: Maps tags to the directives carrying them.
+        types: Maps directive types to the directives of that type.
+    """
+
+    accounts: dict[str, array]
+    chronological: array | None
+    dates: list[date]
+    ids: dict[str, int]
+    links: dict[str, array]
+    payees: dict[str, array]
+    tags: dict[str, array]
+    types: dict[type[ModelDirective], array]
+
+    def __init__(self, entries: models.Directives):
+        """Builds the indexes for the given directives.
+
+        Args:
+            entries: The directives to index.
+        """
+        self.accounts = {}
+        self.ids = {}
+        self.links = {}
+        self.payees = {}
+        self.tags = {}
+        self.types = {}
+
+        source: Sequence[Any] = entries.__root__
+        if isinstance(source, LazyDirectives):
+            source = source.raw
+
+        self.dates = [entry.date for entry in source]
+        self.chronological = None
+        if any(a > b for a, b in zip(self.dates, self.dates[1:])):
+            self.chronological = positions(
+                sorted(range(len(self.dates)), key=self.dates.__getitem__)
+            )
+            self.dates.sort()
+
+        for pos, entry in enumerate(source):
+            model_type = type_map.get(type(entry))
+            if model_type is None:
+                _add(self.types, type(entry), pos)
+                entry_id = entry.id
+            else:
+                _add(self.types, model_type, pos)
+                entry_id = directive_id(entry)
+
+            if entry_id is not None:
+                self.ids[entry_id] = pos
+
+            for account in _accounts(entry):
+                _add(self.accounts, account, pos)
+            for tag in getattr(entry, "tags", None) or ():
+                _add(self.tags, tag, pos)
+            for link in getattr(entry, "links", None) or ():
+                _add(self.links, link, pos)
+            if isinstance(entry, _TRANSACTION) and entry.payee:
+                _add(self.payees, entry.payee, pos)
+
+    def between(
+        self,
+        pos: Sequence[int] | None,
+        start: date | None = None,
+        end: date | None = None,
+    ) -> Sequence[int]:
+        """Restricts the given positions to directives within a date range.
+
+        Args:
+            pos: The ascending positions to restrict, or None for all
+                directives.
+            start: If given, only directives on or after this date are kept.
+            end: If given, only directives before this date are kept.
+
+        Returns:
+            The ascending positions of the directives within the range.
+        """
+        if start is None and end is None:
+            return range(len(self.dates)) if pos is None else pos
+
+        lo = bisect_left(self.dates, start) if start else 0
+        hi = bisect_left(self.dates, end) if end else len(self.dates)
+
+        return self.within(pos, lo, hi)
+
+    def within(
+        self, pos: Sequence[int] | None, lo: int, hi: int
+    ) -> Sequence[int]:
+        """Restricts the given positions to a range of the sorted dates.
+
+        Args:
+            pos: The ascending positions to restrict, or None for all
+                directives.
+            lo: The index into `dates` of the earliest date to keep.
+            hi: The index into `dates` after the latest date to keep.
+
+        Returns:
+            The ascending positions of the directives within the range.
+        """
+        if self.chronological is None:
+            if pos is None:
+                return range(lo, hi)
+            first, last = bisect_left(pos, lo), bisect_left(pos, hi)
+            return pos[first:last]
+
+        matched = self.chronological[lo:hi]
+        if pos is None:
+            return sorted(matched)
+
+        within = set(matched)
+        return [p for p in pos if p in within]
+
+
+def intersect(a: Sequence[int], b: Sequence[int]) -> Sequence[int]:
+    """Intersects two ascending sequences of positions.
+
+    The smaller sequence is walked while the larger one is searched with a
+    galloping (exponential) search starting from the previous match, so the
+    cost depends on the size of the smaller sequence and the distances
+    between matches rather than the size of the larger sequence.
+
+    Args:
+        a: The first ascending sequence.
+        b: The second ascending sequence.
+
+    Returns:
+        The ascending positions contained in both sequences.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+
+    if isinstance(b, range):
+        first, last = bisect_left(a, b.start), bisect_left(a, b.stop)
+        return a[first:last]
+    elif len(b) < len(a) * _GALLOP_RATIO:
+        # Galloping only pays off when the sizes differ a lot, otherwise the
+        # hashing done by sets in C is faster than bisecting in Python
+        return positions(filter(set(a).__contains__, b))
+
+    result = positions()
+    lo, size = 0, len(b)
+    for pos in a:
+        step = 1
+        while lo + step < size and b[lo + step] < pos:
+            step *= 2
+
+        lo = bisect_left(b, pos, lo + step // 2, min(lo + step + 1, size))
+        if lo == size:
+            break
+        elif b[lo] == pos:
+            result.append(pos)
+
+    return result
+
+
+def intersect_all(sequences: list[Sequence[int]]) -> Sequence[int]:
+    """Intersects any number of ascending sequences of positions.
+
+    Sequences are intersected smallest first, which keeps intermediate
+    results as small as possible and stops as soon as one is empty.
+
+    Args:
+        sequences: The ascending sequences to intersect.
+
+    Returns:
+        The ascending positions contained in all sequences.
+    """
+    if not sequences:
+        return positions()
+
+    ordered = sorted(sequences, key=len)
+    result = ordered[0][:]
+    for sequence in ordered[1:]:
+        if not result:
+            break
+        result = intersect(result, sequence)
+
+    return result
+
+
+def _accounts(entry: ModelDirective | data.Directive) -> set[str]:
+    """Returns the accounts referenced by the given directive.
+
+    Args:
+        entry: The directive, or raw entry, to inspect.
+
+    Returns:
+        A set of account names.
+    """
+    if isinstance(entry, _TRANSACTION):
+        return {p.account for p in entry.postings}
+    elif isinstance(entry, _SIMPLE):
+        return {entry.account}
+    elif isinstance(entry, (models.Pad, data.Pad)):
+        return {entry.account, entry.source_account}
+    elif isinstance(entry, (models.Custom, data.Custom)):
+        return {v for v in entry.values if isinstance(v, str)}
+
+    return set()
+
+
+def _add(index: dict, key, pos: int) -> None:
+    """Appends a position to the given key of an index.
+
+    Args:
+        index: The index to add to.
+        key: The key to add the position under.
+        pos: The position to add.
+    """
+    if key not in index:
+        index[key] = positions()
+    index[key].append(pos)
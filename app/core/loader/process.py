@@ -0,0 +1,165 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util
+from typing import Any, Callable
+
+from app.core import base, beancount
+from bdantic import models
+from loguru import logger
+
+
+class ProcessLoader(base.BaseLoader):
+    """Loads ledgers in a pool of worker processes.
+
+    Parsing a ledger and converting it into a `BeancountFile` is CPU bound and
+    holds the GIL for the entire duration when done in-process. This loader
+    moves the work into a separate process and ships the result back as a
+    pickled byte stream, leaving the API process free to answer requests from
+    the previous snapshot in the meantime.
+
+    The pool is created lazily on first use and uses the `spawn` start method
+    so that no state (i.e. a running event loop) is inherited from the API
+    process. Incremental loading state lives in the worker processes and is
+    only reused when a load is handled by the same worker, which is always the
+    case with a single worker.
+
+    Workers are told which directives the API process already holds from the
+    previous load and only send the directives which changed, which are then
+    merged with the unchanged models of the previous load.
+
+    Attributes:
+        executor: The process pool used for loading.
+        shared: The models of the previously loaded directives.
+    """
+
+    executor: ProcessPoolExecutor | None = None
+    shared: beancount.ModelCache
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.shared = beancount.ModelCache()
+
+    def from_file(self, path: str) -> models.BeancountFile:
+        known = self.shared.known()
+        result = self._run(
+            _from_file,
+            path,
+            self.settings.loader_incremental,
+            self.settings.loader_lazy,
+            self.settings.loader_convert_workers,
+            frozenset(known),
+        )
+        return self.share(beancount.loads(result, known))
+
+    def from_string(self, contents: str) -> models.BeancountFile:
+        known = self.shared.known()
+        result = self._run(
+            _from_string,
+            contents,
+            self.settings.loader_lazy,
+            self.settings.loader_convert_workers,
+            frozenset(known),
+        )
+        return self.share(beancount.loads(result, known))
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def _run(self, fn: Callable[..., bytes], *args: Any) -> bytes:
+        """Runs the given function in a worker process.
+
+        A worker which dies abruptly (i.e. killed for running out of memory)
+        breaks the entire pool. In that case the pool is replaced with a new
+        one and the function is run once more.
+
+        Args:
+            fn: The function to run.
+            *args: The arguments to call the function with.
+
+        Returns:
+            The result of the function.
+        """
+        try:
+            return self._pool().submit(fn, *args).result()
+        except BrokenProcessPool:
+            logger.warning("A loader process died, restarting the pool")
+            self.close()
+            return self._pool().submit(fn, *args).result()
+
+    def share(self, bf: models.BeancountFile) -> models.BeancountFile:
+        dirs = bf.entries.__root__
+        if isinstance(dirs, beancount.DirectiveList):
+            self.shared.share(dirs)
+
+        return bf
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """Returns the process pool, creating it if necessary.
+
+        Returns:
+            The process pool used for loading.
+        """
+        if not self.executor:
+            logger.info(
+                f"Starting {self.settings.loader_workers} loader process(es)"
+            )
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.settings.loader_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+
+        return self.executor
+
+
+def _init_worker() -> None:
+    """Prepares a worker process for loading.
+
+    Workers may start their own pool of processes for converting entries,
+    which exiting workers wait for. The pool is shut down while the worker
+    exits, before the queues it needs for that are closed, otherwise
+    shutting down the loader never returns.
+    """
+    util.Finalize(None, beancount.shutdown, exitpriority=100)
+
+
+def _from_file(
+    path: str, incremental: bool, lazy: bool, workers: int, known: frozenset
+) -> bytes:
+    """Loads the ledger at the given path and serializes the result.
+
+    Args:
+        path: The full path to the beancount ledger file.
+        incremental: Whether to reuse the work of previous loads.
+        lazy: Whether to convert directives only when first accessed.
+        workers: The number of processes to convert directives with.
+        known: The digests of the directives held by the API process.
+
+    Returns:
+        The serialized `BeancountFile`.
+    """
+    return beancount.dumps(
+        beancount.from_file(path, incremental, lazy, workers), known
+    )
+
+
+def _from_string(
+    contents: str, lazy: bool, workers: int, known: frozenset
+) -> bytes:
+    """Loads the given ledger contents and serializes the result.
+
+    Args:
+        contents: The raw contents of a beancount ledger.
+        lazy: Whether to convert directives only when first accessed.
+        workers: The number of processes to convert directives with.
+        known: The digests of the directives held by the API process.
+
+    Returns:
+        The serialized `BeancountFile`.
+    """
+    return beancount.dumps(
+        beancount.from_string(contents, lazy, workers), known
+    )
@@ -0,0 +1,35 @@
+from app.core import base, beancount
+from bdantic import models
+
+
+class ThreadLoader(base.BaseLoader):
+    """Loads ledgers in the calling thread.
+
+    The cache always runs storage providers in a worker thread, so this loader
+    keeps the event loop responsive without any additional overhead. Parsing
+    still competes with request handling for the GIL, see `ProcessLoader` for
+    an alternative that avoids this. Converting directives into models can
+    additionally be spread over a pool of processes, which is shut down when
+    the loader is closed.
+    """
+
+    def from_file(self, path: str) -> models.BeancountFile:
+        return beancount.from_file(
+            path,
+            self.settings.loader_incremental,
+            self.settings.loader_lazy,
+            self.settings.loader_convert_workers,
+        )
+
+    def from_string(self, contents: str) -> models.BeancountFile:
+        return beancount.from_string(
+            contents,
+            self.settings.loader_lazy,
+            self.settings.loader_convert_workers,
+        )
+
+    def share(self, bf: models.BeancountFile) -> models.BeancountFile:
+        return beancount.share(bf)
+
+    def close(self) -> None:
+        beancount.shutdown()
@@ -1,8 +1,18 @@
+from __future__ import annotations
+
 import enum
+import heapq
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from datetime import date
+from typing import Any, Sequence
 
-from app.core import search
+import cachetools
+import jmespath  # type: ignore
+from app.core import cache, index
+from app.core.search import DirectiveSearcher
 from bdantic import models
+from jmespath.parser import ParsedResult  # type: ignore
 
 
 class MutatePriority(str, enum.Enum):
@@ -12,62 +22,433 @@ class MutatePriority(str, enum.Enum):
     search = "search"
 
 
+class SearchMode(str, enum.Enum):
+    """An enum controlling how search expressions are matched.
+
+    Exact searches match whole tokens and keep the ledger order. Ranked
+    searches also match tokens by prefix and order the results by relevance,
+    fuzzy searches additionally match tokens with a similar spelling.
+    """
+
+    exact = "exact"
+    ranked = "ranked"
+    fuzzy = "fuzzy"
+
+
 @dataclass
 class DirectivesMutator:
     """Mutates a list of directives via filtering/search.
 
+    The mutator works on the positions of directives within a snapshot and
+    only materializes the resulting directives once at the end. Date ranges,
+    searches and the comparisons of filter expressions which can be answered
+    from the indexes of the snapshot are all resolved to ascending positions,
+    which are then intersected smallest first. Any part of a filter expression
+    which needs evaluating is only evaluated against the final intersection.
+
+    Filter expressions which select directives as a whole commute with
+    searches, so the priority only matters for expressions which transform
+    the directives: these are either evaluated on the search results or have
+    their results searched.
+
     Attributes:
         filter_expr: The JMESPath filter expression.
         search_expr: The string to perform a full text search with.
         priority: Whether filtering or searching should be applied first.
+        start: Only directives on or after this date are included.
+        end: Only directives before this date are included.
+        search_mode: How the search expression is matched.
+        limit: The maximum number of directives to return.
+        offset: The number of leading results to skip, for continuing from
+            a previous page of results.
     """
 
     filter_expr: str | None = None
     search_expr: str | None = None
     priority: MutatePriority | None = MutatePriority.filter
+    start: date | None = None
+    end: date | None = None
+    search_mode: SearchMode = SearchMode.exact
+    limit: int | None = None
+    offset: int = 0
 
-    def mutate(self, data: models.Directives) -> models.Directives:
-        """Mutates the directives using the configured filter/search expression.
+    def mutate(
+        self, snapshot: cache.Snapshot, positions: Sequence[int] | None = None
+    ) -> models.Directives:
+        """Mutates the directives using the configured expressions.
 
         Args:
-            data: The directives to mutate.
+            snapshot: The snapshot containing the directives.
+            positions: The ascending positions of the directives to mutate,
+                or None to mutate all directives.
 
         Returns:
             A mutated version of the directives.
         """
-        if self.priority == MutatePriority.filter:
-            return self.search(self.filter(data))
-        else:
-            return self.filter(self.search(data))
+        return self.page(snapshot, positions)[0]
+
+    def page(
+        self, snapshot: cache.Snapshot, positions: Sequence[int] | None = None
+    ) -> tuple[models.Directives, int | None]:
+        """Mutates the directives and returns a page of the results.
+
+        The page starts at the configured offset and holds at most `limit`
+        directives. Only the directives on the page are materialized, the
+        results before and after it are only ever handled as positions.
+
+        Args:
+            snapshot: The snapshot containing the directives.
+            positions: The ascending positions of the directives to mutate,
+                or None to mutate all directives.
+
+        Returns:
+            A tuple of the mutated directives on the page and the offset of
+            the next page, or None if this is the last page.
+        """
+        positions = snapshot.indexes.between(positions, self.start, self.end)
+        ranks = self.rank(snapshot.searcher) if self.search_expr else None
+
+        expr = _compile(self.filter_expr) if self.filter_expr else None
+        if expr is None or _selects(expr.parsed):
+            constraints, exact = [positions], True
+            if expr is not None:
+                narrowed, exact = _pushdown(snapshot.indexes, expr.parsed)
+                constraints.extend(narrowed)
+            if self.search_expr:
+                constraints.append(self.found(snapshot.searcher, ranks))
+
+            candidates = index.intersect_all(constraints)
+            if not exact:
+                selected = self.filter(snapshot, candidates)
+                assert not isinstance(selected, models.Directives)
+                candidates = selected
+
+            selected, after = self.top(candidates, ranks)
+            return snapshot.directives(selected), after
+
+        search_first = self.priority != MutatePriority.filter
+        if self.search_expr and search_first:
+            positions = self.search(snapshot.searcher, positions, ranks)
+
+        result = self.filter(snapshot, positions)
+        if isinstance(result, models.Directives):
+            # The filter expression transformed the directives, so they can
+            # only be searched by indexing the transformed directives
+            entries = result.__root__
+            found: Sequence[int] = range(len(entries))
+            ranks = None
+            if not search_first and self.search_expr:
+                searcher = DirectiveSearcher(result)
+                ranks = self.rank(searcher)
+                found = self.search(searcher, found, ranks)
+
+            selected, after = self.top(found, ranks)
+            return (
+                models.Directives(__root__=[entries[i] for i in selected]),
+                after,
+            )
+
+        if not search_first and self.search_expr:
+            result = self.search(snapshot.searcher, result, ranks)
+
+        selected, after = self.top(result, ranks)
+        return snapshot.directives(selected), after
+
+    def found(
+        self,
+        searcher: DirectiveSearcher,
+        ranks: dict[int, float] | None = None,
+    ) -> Sequence[int]:
+        """Returns the positions of all directives matching the search.
 
-    def search(self, data: models.Directives) -> models.Directives:
+        Args:
+            searcher: The searcher for the directives.
+            ranks: The result of `rank`, if the search is ranked.
+
+        Returns:
+            The ascending positions of the matching directives.
+        """
+        assert self.search_expr is not None
+        if ranks is None:
+            return searcher.positions(self.search_expr)
+
+        return sorted(ranks)
+
+    def search(
+        self,
+        searcher: DirectiveSearcher,
+        positions: Sequence[int],
+        ranks: dict[int, float] | None = None,
+    ) -> Sequence[int]:
         """Performs a full-text search using the configured search expression.
 
+        Searches against a snapshot use its full-text index, which is built
+        on the first search and then shared by all requests.
+
         Args:
-            data: The directives to search against
+            searcher: The searcher for the directives.
+            positions: The ascending positions of the directives to search.
+            ranks: The result of `rank`, if the search is ranked.
 
         Returns:
-            A mutated version of the directives.
+            The ascending positions of the matching directives.
+        """
+        if not self.search_expr:
+            return positions
+
+        return index.intersect(positions, self.found(searcher, ranks))
+
+    def rank(self, searcher: DirectiveSearcher) -> dict[int, float] | None:
+        """Scores the directives matching the search expression.
+
+        Args:
+            searcher: The searcher for the directives.
+
+        Returns:
+            A dictionary mapping the positions of the matching directives to
+            their score, or None if the search isn't ranked.
+        """
+        if not self.search_expr or self.search_mode == SearchMode.exact:
+            return None
+
+        fuzzy = self.search_mode == SearchMode.fuzzy
+        return searcher.rank(self.search_expr, fuzzy)
+
+    def top(
+        self, positions: Sequence[int], ranks: dict[int, float] | None
+    ) -> tuple[Sequence[int], int | None]:
+        """Orders the results by their rank and applies the offset and limit.
+
+        Unranked results keep their order, so the page is a slice of them.
+        Only the results up to the end of the page are selected when ranking
+        with a limit, so ranking a large number of results doesn't require
+        sorting all of them.
+
+        Args:
+            positions: The positions of the results.
+            ranks: The result of `rank`, if the search is ranked.
+
+        Returns:
+            A tuple of the positions of the results on the page and the
+            offset of the next page, or None if there are no more results.
         """
-        if self.search_expr:
-            return search.DirectiveSearcher(data).search(self.search_expr)
+        start = self.offset
+        end = len(positions) if self.limit is None else start + self.limit
+        after = end if end < len(positions) else None
+        if ranks is None:
+            return positions[start:end], after
+
+        def key(pos: int) -> tuple[float, int]:
+            return ranks[pos], -pos
+
+        if self.limit is None:
+            ordered = sorted(positions, key=key, reverse=True)
         else:
-            return data
+            ordered = heapq.nlargest(end, positions, key=key)
+        return ordered[start:end], after
 
-    def filter(self, data: models.Directives) -> models.Directives:
+    def filter(
+        self, snapshot: cache.Snapshot, positions: Sequence[int]
+    ) -> Sequence[int] | models.Directives:
         """Performs a filter using the configured JMESPath filter expression.
 
+        The expression is evaluated against the cached plain view of the
+        snapshot. When the expression selects directives as a whole and keeps
+        their order, as filter expressions do, the positions of the selected
+        directives are returned. Any other result is parsed back into
+        directives.
+
+        Simple comparisons in filter expressions are pushed down into the
+        indexes of the snapshot first, see `_pushdown`. If every comparison
+        could be answered from the indexes the expression isn't evaluated at
+        all, otherwise it's only evaluated against the narrowed directives.
+
         Args:
-            data: The directives to filter
+            snapshot: The snapshot containing the directives.
+            positions: The ascending positions of the directives to filter.
 
         Returns:
-            A mutated version of the directives.
+            The ascending positions of the selected directives, or the parsed
+            result if the expression transformed the directives.
         """
-        if self.filter_expr:
-            result = data.filter(self.filter_expr)
-            if result:
-                return result
-            else:
-                return models.Directives(__root__=[])
-
-        return data
+        if not self.filter_expr:
+            return positions
+
+        expr = _compile(self.filter_expr)
+        narrowed, exact = _pushdown(snapshot.indexes, expr.parsed)
+        if narrowed:
+            positions = index.intersect_all([positions, *narrowed])
+        if exact:
+            return positions
+
+        view = snapshot.view
+        result = expr.search([view[p] for p in positions])
+        if not result:
+            return index.positions()
+
+        if isinstance(result, list):
+            lookup = {id(view[p]): p for p in positions}
+            if all(id(r) in lookup for r in result):
+                selected = index.positions(lookup[id(r)] for r in result)
+                if all(a < b for a, b in zip(selected, selected[1:])):
+                    return selected
+
+        return models.Directives.parse_obj(result)
+
+
+@cachetools.cached(cachetools.LRUCache(maxsize=256))
+def _compile(expr: str) -> ParsedResult:
+    """Compiles the given JMESPath expression.
+
+    Args:
+        expr: The JMESPath expression to compile.
+
+    Returns:
+        The compiled expression.
+    """
+    return jmespath.compile(expr)
+
+
+# Flips a comparator for swapping its operands
+_FLIPPED = {
+    "eq": "eq",
+    "ne": "ne",
+    "lt": "gt",
+    "lte": "gte",
+    "gt": "lt",
+    "gte": "lte",
+}
+
+
+def _selects(node: dict[str, Any]) -> bool:
+    """Returns whether an expression only selects directives as a whole.
+
+    Args:
+        node: The root node of the parsed expression.
+
+    Returns:
+        True if the expression is a filter projection over the directives
+        which projects the directives themselves.
+    """
+    if node["type"] != "filter_projection":
+        return False
+
+    lhs, rhs, _ = node["children"]
+    return lhs["type"] == "identity" and rhs["type"] == "identity"
+
+
+def _pushdown(
+    indexes: index.Indexes, node: dict[str, Any]
+) -> tuple[list[Sequence[int]], bool]:
+    """Resolves the comparisons of a filter expression using the indexes.
+
+    Only filter projections over the directives (`[?...]`) are analyzed. The
+    condition is split into its conjunctions and each comparison of the
+    `date`, `account`, `payee` or `ty` field against a string literal is
+    answered from the indexes. As the projection is evaluated for each
+    directive on its own, evaluating it against the intersection of the
+    resolved positions gives the same result as evaluating it against all
+    directives.
+
+    Args:
+        indexes: The indexes to answer comparisons from.
+        node: The root node of the parsed expression.
+
+    Returns:
+        A tuple of the ascending positions resolved for each comparison that
+        could be answered, and whether their intersection is exactly what the
+        expression selects, in which case it doesn't need to be evaluated.
+    """
+    if node["type"] != "filter_projection":
+        return [], False
+
+    lhs, rhs, condition = node["children"]
+    if lhs["type"] != "identity":
+        return [], False
+
+    narrowed = []
+    exact = rhs["type"] == "identity"
+    for conjunct in _conjuncts(condition):
+        restricted = _restrict(indexes, conjunct)
+        if restricted is None:
+            exact = False
+        else:
+            narrowed.append(restricted[0])
+            exact = exact and restricted[1]
+
+    return narrowed, exact
+
+
+def _conjuncts(node: dict[str, Any]) -> list[dict[str, Any]]:
+    """Splits a condition into the conditions which must all be true.
+
+    Args:
+        node: The condition node.
+
+    Returns:
+        A list of condition nodes.
+    """
+    if node["type"] == "and_expression":
+        return [c for child in node["children"] for c in _conjuncts(child)]
+
+    return [node]
+
+
+def _restrict(
+    indexes: index.Indexes, node: dict[str, Any]
+) -> tuple[Sequence[int], bool] | None:
+    """Resolves the positions of the directives satisfying a comparison.
+
+    Dates in the plain view are ISO formatted strings which JMESPath compares
+    lexicographically, so ordering comparisons against them are answered by
+    bisecting the sorted dates by their ISO representation.
+
+    Args:
+        indexes: The indexes to answer the comparison from.
+        node: The condition node.
+
+    Returns:
+        None if the comparison can't be answered from the indexes. Otherwise
+        a tuple of the ascending positions and whether they exactly satisfy
+        the comparison rather than being a superset.
+    """
+    if node["type"] != "comparator":
+        return None
+
+    op = node["value"]
+    field, literal = node["children"]
+    if field["type"] == "literal":
+        field, literal, op = literal, field, _FLIPPED[op]
+
+    if field["type"] != "field" or literal["type"] != "literal":
+        return None
+
+    name, value = field["value"], literal["value"]
+    if not isinstance(value, str) or not value:
+        return None
+
+    if name == "date" and op != "ne":
+        dates, key = indexes.dates, date.isoformat
+        lo, hi = 0, len(dates)
+        if op in ("gte", "eq"):
+            lo = bisect_left(dates, value, key=key)
+        elif op == "gt":
+            lo = bisect_right(dates, value, key=key)
+        if op in ("lte", "eq"):
+            hi = bisect_right(dates, value, key=key)
+        elif op == "lt":
+            hi = bisect_left(dates, value, key=key)
+        return indexes.within(None, lo, hi), True
+    elif op != "eq":
+        return None
+    elif name == "account":
+        # Transactions and pads are indexed by accounts they don't have in
+        # their `account` field, so the expression still needs evaluating
+        return indexes.accounts.get(value, index.positions()), False
+    elif name == "payee":
+        return indexes.payees.get(value, index.positions()), True
+    elif name == "ty":
+        types = {t.__name__: p for t, p in indexes.types.items()}
+        return types.get(value, index.positions()), True
+
+    return None
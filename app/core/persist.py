@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import struct
+import sys
+from importlib import metadata
+from typing import TYPE_CHECKING
+
+from app.core.sources import Sources
+from loguru import logger
+
+if TYPE_CHECKING:
+    from app.core.cache import Snapshot
+
+# Increment whenever the layout of persisted snapshots changes
+VERSION = 4
+
+_MAGIC = b"BAPI"
+_PREFIX = struct.Struct("<4sII")
+
+
+class SnapshotStore:
+    """Persists snapshots to disk so that they can be restored on startup.
+
+    Snapshots are written to a single file consisting of a fixed size prefix
+    (magic bytes, format version and header length), a JSON header and the
+    pickled snapshot. The header records the source files the snapshot was
+    loaded from along with a digest of their contents and the files their
+    include patterns matched without being loaded. A snapshot is only
+    restored if both still match the files currently on disk, in which case
+    it's unpickled directly from the file instead of parsing the ledger
+    again.
+
+    Pickles are only compatible with the same versions of the models they
+    contain, so snapshots written by a different Python or bdantic version
+    are ignored as well.
+
+    Attributes:
+        path: The path of the file snapshots are persisted to.
+    """
+
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> tuple[Snapshot, Sources] | None:
+        """Restores the persisted snapshot if it's still up to date.
+
+        Returns:
+            A tuple of the restored snapshot and its source files, or None if
+            there is no usable snapshot.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+
+        with f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) != _PREFIX.size:
+                return None
+
+            magic, version, length = _PREFIX.unpack(prefix)
+            if magic != _MAGIC or version != VERSION:
+                logger.info("Ignoring persisted snapshot with unknown format")
+                return None
+
+            header = json.loads(f.read(length))
+            if header["runtime"] != _runtime():
+                logger.info("Ignoring persisted snapshot from another runtime")
+                return None
+
+            sources = Sources(header["files"])
+            if (
+                sources.recorded_digest != header["digest"]
+                or sorted(sources.unloaded) != header["unloaded"]
+            ):
+                logger.info("Ignoring outdated persisted snapshot")
+                return None
+
+            snapshot = pickle.load(f)
+
+        return snapshot, sources
+
+    def write(self, snapshot: Snapshot, sources: Sources) -> None:
+        """Persists the given snapshot.
+
+        The snapshot is written to a temporary file first which then replaces
+        the existing file, so readers never observe a partially written file.
+
+        Args:
+            snapshot: The snapshot to persist.
+            sources: The source files the snapshot was loaded from.
+        """
+        header = json.dumps(
+            {
+                "digest": sources.recorded_digest,
+                "files": sources.paths,
+                "unloaded": sorted(sources.unloaded),
+                "runtime": _runtime(),
+            }
+        ).encode("utf-8")
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_PREFIX.pack(_MAGIC, VERSION, len(header)))
+            f.write(header)
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+
+def _runtime() -> str:
+    """Returns a string identifying the versions pickles depend on.
+
+    Returns:
+        The Python and bdantic versions.
+    """
+    python = ".".join(str(v) for v in sys.version_info[:3])
+    return f"python-{python} bdantic-{metadata.version('bdantic')}"
@@ -1,15 +1,29 @@
 from __future__ import annotations
 
+import functools
+import math
 import re
 import string
+from array import array
+from bisect import bisect_left
 from dataclasses import dataclass
-from typing import Any, Generic, TypeVar
+from typing import Any, Generic, Sequence, TypeVar
 
+from app.core.beancount import LazyDirectives
+from app.core.index import intersect_all, positions
 from bdantic import models
-from bdantic.types import ModelDirective
+
+from beancount.core import data
 
 T = TypeVar("T")
 
+# BM25 term saturation and length normalization parameters
+_K1 = 1.2
+_B = 0.75
+
+# The minimum trigram similarity for tokens to be considered a fuzzy match
+_FUZZY_THRESHOLD = 0.3
+
 
 class FullTextSearch:
     """Indexes a list of objects and provides full-texth search across them.
@@ -19,6 +33,17 @@ class FullTextSearch:
     second entry is an object to associate with the string. The index is then
     constructed by tokenizing the string and associating the result with the
     object. The result is a searchable index.
+
+    Each token maps to a posting list: a compact, sorted array of the IDs of
+    the entries containing the token. Queries intersect the posting lists of
+    their tokens, see `app.core.index.intersect`, and return entries in the
+    order they were indexed.
+
+    Alternatively, queries can be ranked with `rank`. Ranked queries match
+    tokens by prefix using a sorted dictionary of all tokens, and optionally
+    match misspelled tokens using a trigram index of the dictionary. Matches
+    are scored with BM25, treating every token as occurring once per entry
+    as indexed texts are short.
     """
 
     def __init__(self, index: list[tuple[str, Any]]):
@@ -30,7 +55,11 @@ class FullTextSearch:
                 searchable string.
         """
         self._entries: dict[int, Any] = {}
-        self._index: dict[str, set[int]] = {}
+        self._index: dict[str, array] = {}
+        self._lengths = positions()
+        self._total = 0
+        self._vocabulary: list[str] | None = None
+        self._trigrams: dict[str, list[int]] | None = None
         for eid, entry in enumerate(index):
             self._index_entry(eid, entry[0], entry[1])
 
@@ -49,9 +78,148 @@ class FullTextSearch:
         Returns:
             A list of entries which satisfy the given search query.
         """
+        return [self._entries[id] for id in self.ids(query)]
+
+    def ids(self, query: str) -> Sequence[int]:
+        """Searches the index and returns the IDs of the matching entries.
+
+        The ID of an entry is its position in the list the index was created
+        with.
+
+        Args:
+            query: The query string to search with.
+
+        Returns:
+            The ascending IDs of entries which satisfy the given search query.
+        """
         tokens = self._tokenize(query)
-        indexes = [self._index.get(token, set()) for token in tokens]
-        return [self._entries[id] for id in set.intersection(*indexes)]
+        if not tokens:
+            return positions()
+
+        empty = positions()
+        return intersect_all(
+            [self._index.get(token, empty) for token in set(tokens)]
+        )
+
+    def rank(self, query: str, fuzzy: bool = False) -> dict[int, float]:
+        """Searches the index and scores the matching entries.
+
+        Every token of the query must be matched by an entry, either exactly
+        or as the prefix of a token of the entry. With fuzzy matching, tokens
+        which are similar to the query token are matched as well. Partial
+        matches are weighted by how similar the matched token is.
+
+        Args:
+            query: The query string to search with.
+            fuzzy: Whether to match tokens similar to the query tokens.
+
+        Returns:
+            A dictionary mapping the IDs of matching entries to their score.
+        """
+        tokens = [t for t in dict.fromkeys(self._tokenize(query)) if t]
+        if not tokens:
+            return {}
+
+        count = len(self._entries)
+        average = self._total / count if count else 0
+        scores: dict[int, float] | None = None
+        for token in tokens:
+            matched: dict[int, float] = {}
+            for term, weight in self._expand(token, fuzzy).items():
+                postings = self._index[term]
+                freq = len(postings)
+                idf = math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+                for id in postings:
+                    if scores is not None and id not in scores:
+                        continue
+
+                    length = self._lengths[id] / average if average else 0
+                    score = (
+                        weight
+                        * idf
+                        * (_K1 + 1)
+                        / (1 + _K1 * (1 - _B + _B * length))
+                    )
+                    if score > matched.get(id, 0):
+                        matched[id] = score
+
+            if scores is None:
+                scores = matched
+            else:
+                scores = {id: scores[id] + s for id, s in matched.items()}
+
+            if not scores:
+                return {}
+
+        return scores or {}
+
+    def _expand(self, token: str, fuzzy: bool) -> dict[str, float]:
+        """Finds the indexed tokens matching a query token.
+
+        Args:
+            token: The query token.
+            fuzzy: Whether to include similar tokens.
+
+        Returns:
+            A dictionary mapping matching tokens to the weight of the match.
+        """
+        terms: dict[str, float] = {}
+        if token in self._index:
+            terms[token] = 1.0
+
+        vocabulary = self._sorted_vocabulary()
+        i = bisect_left(vocabulary, token)
+        while i < len(vocabulary) and vocabulary[i].startswith(token):
+            terms.setdefault(vocabulary[i], len(token) / len(vocabulary[i]))
+            i += 1
+
+        if fuzzy:
+            for term, similarity in self._similar(token).items():
+                terms[term] = max(terms.get(term, 0), similarity)
+
+        return terms
+
+    def _similar(self, token: str) -> dict[str, float]:
+        """Finds indexed tokens with a trigram similarity above a threshold.
+
+        Args:
+            token: The query token.
+
+        Returns:
+            A dictionary mapping similar tokens to their similarity.
+        """
+        vocabulary = self._sorted_vocabulary()
+        if self._trigrams is None:
+            self._trigrams = {}
+            for i, term in enumerate(vocabulary):
+                for trigram in _trigrams(term):
+                    self._trigrams.setdefault(trigram, []).append(i)
+
+        wanted = _trigrams(token)
+        shared: dict[int, int] = {}
+        for trigram in wanted:
+            for i in self._trigrams.get(trigram, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        similar = {}
+        for i, common in shared.items():
+            term = vocabulary[i]
+            union = len(wanted) + len(_trigrams(term)) - common
+            if common / union >= _FUZZY_THRESHOLD:
+                similar[term] = common / union
+
+        return similar
+
+    def _sorted_vocabulary(self) -> list[str]:
+        """Returns all indexed tokens in sorted order.
+
+        Returns:
+            A sorted list of tokens.
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(t for t in self._index if t)
+
+        return self._vocabulary
 
     def _index_entry(self, entry_id: int, text: str, entry: Any):
         """Indexes an entry.
@@ -66,10 +234,25 @@ class FullTextSearch:
         if entry_id not in self._entries:
             self._entries[entry_id] = entry
 
+        if entry_id >= len(self._lengths):
+            self._lengths.extend([0] * (entry_id + 1 - len(self._lengths)))
+        self._total += len(tokens) - self._lengths[entry_id]
+        self._lengths[entry_id] = len(tokens)
+
         for token in tokens:
             if token not in self._index:
-                self._index[token] = set()
-            self._index[token].add(entry_id)
+                self._index[token] = positions()
+                self._vocabulary = self._trigrams = None
+
+            postings = self._index[token]
+            if not postings or postings[-1] < entry_id:
+                postings.append(entry_id)
+                continue
+
+            # Entries indexed out of order need to keep the list sorted
+            i = bisect_left(postings, entry_id)
+            if postings[i] != entry_id:
+                postings.insert(i, entry_id)
 
     def _tokenize(self, full_text: str) -> list[str]:
         """Breaks up a string into its token components.
@@ -89,6 +272,19 @@ class FullTextSearch:
         return tokens
 
 
+def _trigrams(token: str) -> set[str]:
+    """Returns the trigrams of a token, padded to include its boundaries.
+
+    Args:
+        token: The token to split.
+
+    Returns:
+        A set of trigrams.
+    """
+    padded = f"  {token} "
+    return {a + b + c for a, b, c in zip(padded, padded[1:], padded[2:])}
+
+
 @dataclass
 class Searcher(Generic[T]):
     """A class which can perform a full text search across data
@@ -123,6 +319,9 @@ class Searcher(Generic[T]):
 class DirectiveSearcher(Searcher):
     """A class which can create a searchable index from a list of directives.
 
+    The index is built on the first search and reused by all subsequent
+    searches against the same instance.
+
     Attributes:
         data: The list of directives to index.
     """
@@ -132,51 +331,94 @@ class DirectiveSearcher(Searcher):
     def __init__(self, data: models.Directives):
         self.data = data
 
+    @functools.cached_property
+    def fts(self) -> FullTextSearch:
+        """The full-text index of the directives.
+
+        Returns:
+            A `FullTextSearch` instance indexing the directives.
+        """
+        return FullTextSearch(self.index())
+
     def search(self, query: str) -> models.Directives:
+        entries = self.data.__root__
         return models.Directives(
-            __root__=FullTextSearch(self.index()).search(query)
+            __root__=[entries[pos] for pos in self.fts.ids(query)]
         )
 
+    def positions(self, query: str) -> list[int]:
+        """Searches the directives and returns the positions of the results.
+
+        Args:
+            query: The query string to use for searching
+
+        Returns:
+            The ascending positions of the matching directives.
+        """
+        return list(self.fts.ids(query))
+
+    def rank(self, query: str, fuzzy: bool = False) -> dict[int, float]:
+        """Searches the directives and scores the results.
+
+        See `FullTextSearch.rank` for details.
+
+        Args:
+            query: The query string to use for searching
+            fuzzy: Whether to match tokens similar to the query tokens.
+
+        Returns:
+            A dictionary mapping the positions of matching directives to their
+            score.
+        """
+        return self.fts.rank(query, fuzzy)
+
     def index(self):
-        index: list[tuple[str, ModelDirective]] = []
+        index: list[tuple[str, Any]] = []
 
-        for d in self.data:
-            if isinstance(d, models.Balance):
+        # Lazily converted directives are indexed from their raw entries,
+        # which have the same fields, so searching doesn't convert them
+        source: Sequence[Any] = self.data.__root__
+        if isinstance(source, LazyDirectives):
+            source = source.raw
+
+        for d in source:
+            if isinstance(d, (models.Balance, data.Balance)):
                 index.append((d.account, d))
-            elif isinstance(d, models.Close):
+            elif isinstance(d, (models.Close, data.Close)):
                 index.append((d.account, d))
-            elif isinstance(d, models.Commodity):
+            elif isinstance(d, (models.Commodity, data.Commodity)):
                 index.append((d.currency, d))
-            elif isinstance(d, models.Custom):
-                continue
-            elif isinstance(d, models.Document):
+            elif isinstance(d, (models.Custom, data.Custom)):
+                # Not searchable, but keeps entry IDs equal to positions
+                index.append(("", d))
+            elif isinstance(d, (models.Document, data.Document)):
                 s = d.account + " " + d.filename.replace("/", " ")
                 if d.links:
                     s += " " + " ".join(d.links)
                 if d.tags:
                     s += " " + " ".join(d.tags)
                 index.append((s, d))
-            elif isinstance(d, models.Event):
+            elif isinstance(d, (models.Event, data.Event)):
                 index.append((d.type + " " + d.description, d))
-            elif isinstance(d, models.Note):
+            elif isinstance(d, (models.Note, data.Note)):
                 index.append((d.account + " " + d.comment, d))
-            elif isinstance(d, models.Open):
+            elif isinstance(d, (models.Open, data.Open)):
                 s = d.account
                 if d.currencies:
                     s += " " + " ".join(d.currencies)
                 index.append((s, d))
-            elif isinstance(d, models.Pad):
+            elif isinstance(d, (models.Pad, data.Pad)):
                 index.append(
                     (
                         d.account + " " + d.source_account,
                         d,
                     )
                 )
-            elif isinstance(d, models.Price):
+            elif isinstance(d, (models.Price, data.Price)):
                 index.append((d.currency, d))
-            elif isinstance(d, models.Query):
+            elif isinstance(d, (models.Query, data.Query)):
                 index.append((d.name + " " + d.query_string, d))
-            elif isinstance(d, models.Transaction):
+            elif isinstance(d, (models.Transaction, data.Transaction)):
                 s = d.narration
                 if d.payee:
                     s += " " + d.payee
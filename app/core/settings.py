@@ -3,7 +3,9 @@ from enum import Enum
 from functools import cached_property
 
 from app.core.auth.jwt import JWTAuth, JWTConfig
-from app.core.base import BaseAuth, BaseStorage
+from app.core.base import BaseAuth, BaseLoader, BaseStorage
+from app.core.loader.process import ProcessLoader
+from app.core.loader.thread import ThreadLoader
 from app.core.storage.local import LocalStorage
 from app.core.storage.redis import RedisConfig, RedisStorage
 from app.core.storage.s3 import S3Config, S3Storage
@@ -18,6 +20,13 @@ class Storage(str, Enum):
     s3 = "s3"
 
 
+class Loader(str, Enum):
+    """Valid loader types which can be used for parsing ledgers."""
+
+    thread = "thread"
+    process = "process"
+
+
 class Auth(str, Enum):
     """Valid authentication types which can be used with the API."""
 
@@ -33,7 +42,15 @@ class Settings(BaseSettings):
         entrypoint: The filename of the main ledger file to parse.
         work_dir: The local working directory where files will be downloaded.
         cache_interval: Seconds to wait before checking for data changes.
+        cache_watch: Whether to watch for data changes instead of polling.
+        cache_debounce: Seconds of quiet to wait for after a watched change.
+        cache_persist: Whether to persist loaded data for faster startups.
         storage: Where to find Beancount files.
+        loader: Where ledgers are parsed (a worker thread or process).
+        loader_workers: The number of worker processes used for parsing.
+        loader_incremental: Whether to only re-parse changed ledger files.
+        loader_lazy: Whether to convert directives only when first accessed.
+        loader_convert_workers: The number of processes converting directives.
         auth: type of authentication to use on endpoints.
         jwt: Settings for configuring JWT authentication.
         redis: Settings for configuring Redis storage.
@@ -44,17 +61,31 @@ class Settings(BaseSettings):
     entrypoint: str = "main.beancount"
     work_dir: str = "/tmp/bean"
     cache_interval: int = 5
+    cache_watch: bool = False
+    cache_debounce: float = 0.5
+    cache_persist: bool = False
     storage: Storage = Storage.local
+    loader: Loader = Loader.thread
+    loader_workers: int = 1
+    loader_incremental: bool = True
+    loader_lazy: bool = False
+    loader_convert_workers: int = 1
     auth: Auth = Auth.none
     jwt: JWTConfig | None = None
     redis: RedisConfig | None = None
     s3: S3Config | None = None
 
     _auth: BaseAuth | None = PrivateAttr(None)
+    _loader: BaseLoader = PrivateAttr()
     _storage: BaseStorage = PrivateAttr()
 
     _auth_providers: dict[Auth, type[BaseAuth]] = {Auth.jwt: JWTAuth}
 
+    _loader_providers: dict[Loader, type[BaseLoader]] = {
+        Loader.thread: ThreadLoader,
+        Loader.process: ProcessLoader,
+    }
+
     _storage_providers: dict[Storage, type[BaseStorage]] = {
         Storage.local: LocalStorage,
         Storage.redis: RedisStorage,
@@ -72,6 +103,7 @@ class Settings(BaseSettings):
         if self.auth is not Auth.none:
             self._auth = self._auth_providers[self.auth](self)
 
+        self._loader = self._loader_providers[self.loader](self)
         self._storage = self._storage_providers[self.storage](self)
 
     def entry_path(self):
@@ -82,6 +114,14 @@ class Settings(BaseSettings):
         """
         return os.path.join(self.work_dir, self.entrypoint)
 
+    def snapshot_path(self):
+        """Returns the full path to the persisted snapshot file.
+
+        Returns:
+            The path to the persisted snapshot file.
+        """
+        return os.path.join(self.work_dir, ".bapi.snapshot")
+
     def get_auth(self) -> BaseAuth | None:
         """Returns the configured authentication provider, if any.
 
@@ -90,6 +130,14 @@ class Settings(BaseSettings):
         """
         return self._auth
 
+    def get_loader(self) -> BaseLoader:
+        """Returns the configured loader.
+
+        Returns:
+            The configured loader.
+        """
+        return self._loader
+
     def get_storage(self) -> BaseStorage:
         """Returns the configured storage provider.
 
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import re
+from typing import Iterable, NamedTuple
+
+# Size of the chunks read when computing a content digest
+_CHUNK_SIZE = 1024 * 64
+
+# Matches include directives in a beancount ledger
+_INCLUDE = re.compile(rb'^include\s+"([^"]*)"')
+
+
+class Stat(NamedTuple):
+    """The subset of `os.stat` results used to detect file changes."""
+
+    mtime_ns: int
+    size: int
+
+
+class Sources:
+    """Tracks the source files of a ledger to cheaply detect changes.
+
+    Detecting changes is done in two stages. The first stage only stats the
+    files and compares their modification time and size against the values
+    recorded when the ledger was loaded, which costs a handful of syscalls.
+    Only if that indicates a change is a digest of the actual file contents
+    computed and compared, which avoids reloading when a file was merely
+    touched.
+
+    Files only become source files once an include directive matches them,
+    so the include patterns of the source files are tracked as well. A file
+    newly matching one of them is a change, even if no source file changed.
+
+    Attributes:
+        paths: The sorted list of source file paths being tracked.
+        patterns: The sorted list of include patterns of the source files.
+        recorded_digest: The content digest recorded at the last check.
+        unloaded: Files matching an include pattern which aren't source files.
+    """
+
+    paths: list[str]
+    patterns: list[str]
+    recorded_digest: str
+    unloaded: set[str]
+
+    def __init__(self, paths: Iterable[str]):
+        """Records the current state of the given source files.
+
+        Args:
+            paths: The paths to the source files of the ledger.
+        """
+        self.paths = sorted(set(paths))
+        self.patterns = self.includes()
+        self.unloaded = self.matched().difference(self.paths)
+        self._stats = self.stat()
+        self.recorded_digest = self.digest()
+
+    def changed(self) -> bool:
+        """Returns if the contents of any source file has changed.
+
+        Files which newly match an include pattern count as a change.
+
+        Returns:
+            True if a change is detected, False otherwise.
+        """
+        unloaded = self.matched().difference(self.paths)
+        added = unloaded - self.unloaded
+        self.unloaded = unloaded
+        if added:
+            return True
+
+        stats = self.stat()
+        if stats == self._stats:
+            return False
+
+        digest = self.digest()
+        self._stats = stats
+        if digest == self.recorded_digest:
+            return False
+
+        self.recorded_digest = digest
+        return True
+
+    def invalidate(self) -> None:
+        """Forgets the recorded state, so the next check reports a change."""
+        self._stats = []
+        self.recorded_digest = ""
+
+    def digest(self) -> str:
+        """Computes a digest over the contents of all source files.
+
+        Files are read in chunks to avoid loading them into memory at once.
+        Missing files are skipped but still contribute their path.
+
+        Returns:
+            A SHA-256 hex digest.
+        """
+        sha = hashlib.sha256()
+        for path in self.paths:
+            sha.update(path.encode("utf-8") + b"\0")
+            try:
+                with open(path, "rb") as f:
+                    while chunk := f.read(_CHUNK_SIZE):
+                        sha.update(chunk)
+            except FileNotFoundError:
+                continue
+
+        return sha.hexdigest()
+
+    def includes(self) -> list[str]:
+        """Finds the include patterns of all source files.
+
+        Like beancount does, relative patterns are resolved against the
+        directory of the file which includes them.
+
+        Returns:
+            A sorted list of absolute include patterns.
+        """
+        patterns = set()
+        for path in self.paths:
+            cwd = glob.escape(os.path.dirname(path))
+            try:
+                with open(path, "rb") as f:
+                    for line in f:
+                        if match := _INCLUDE.match(line):
+                            pattern = os.fsdecode(match.group(1))
+                            patterns.add(os.path.join(cwd, pattern))
+            except FileNotFoundError:
+                continue
+
+        return sorted(patterns)
+
+    def matched(self) -> set[str]:
+        """Returns the files currently matching any of the include patterns.
+
+        Returns:
+            A set of normalized file paths.
+        """
+        return {
+            os.path.normpath(match)
+            for pattern in self.patterns
+            for match in glob.glob(pattern, recursive=True)
+        }
+
+    def stat(self) -> list[Stat | None]:
+        """Stats all source files.
+
+        Returns:
+            A list of `Stat` (or None if the file is missing) for each path.
+        """
+        stats: list[Stat | None] = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                stats.append(Stat(st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stats.append(None)
+
+        return stats
@@ -1,16 +1,83 @@
-from app.core import base, beancount
+from app.core import base
+from app.core.sources import Sources
+from app.core.watch import Watcher
 from bdantic import models
 from loguru import logger
 
 
 class LocalStorage(base.BaseStorage):
-    """Provides an interface for loading locally stored beancount ledgers."""
+    """Provides an interface for loading locally stored beancount ledgers.
+
+    Changes are detected by watching the source files of the ledger (the
+    entrypoint and every file it includes) and the include patterns matching
+    them rather than the loaded data. This can either be done by polling or
+    by subscribing to inotify events.
+
+    Attributes:
+        sources: The source files of the most recently loaded ledger.
+        watcher: The inotify watcher used when waiting for changes.
+    """
+
+    sources: Sources | None = None
+    watcher: Watcher | None = None
 
     def load(self) -> models.BeancountFile:
-        logger.info(f"Loading data from {self.settings.entry_path()}")
-        bf = beancount.from_file(self.settings.entry_path())
-        self._hash = bf.hash()
+        entry = self.settings.entry_path()
+        logger.info(f"Loading data from {entry}")
+
+        # Record the state of the files before parsing them, so changes made
+        # while parsing are detected by the next check
+        before = Sources(self.sources.paths if self.sources else [entry])
+        bf = self.settings.get_loader().from_file(entry)
+
+        included = bf.options.include or [entry]
+        if sorted(set(included)) == before.paths:
+            self.sources = before
+        else:
+            # Files which are newly included are recorded after parsing, but
+            # changes made to the previous files while parsing still count
+            self.sources = Sources(included)
+            if before.changed():
+                self.sources.invalidate()
+
         return bf
 
-    def changed(self, bf: models.BeancountFile) -> bool:
-        return bf.hash() != self._hash
+    def changed(self, _: models.BeancountFile) -> bool:
+        if self.sources is None:
+            return True
+
+        return self.sources.changed()
+
+    async def wait(self) -> None:
+        if self.sources is None:
+            # Nothing was loaded yet, so a load is due
+            return
+
+        while True:
+            if not self.watcher or (
+                self.watcher.paths != self.sources.paths
+                or self.watcher.patterns != self.sources.patterns
+            ):
+                if self.watcher:
+                    self.watcher.close()
+                self.watcher = Watcher(
+                    self.sources.paths,
+                    self.settings.cache_debounce,
+                    self.sources.patterns,
+                )
+
+                # Catch changes made before the watch was established
+                if self.sources.changed():
+                    return
+
+            await self.watcher.wait()
+            if self.sources.changed():
+                return
+
+    def source_files(self) -> Sources | None:
+        return self.sources
+
+    def restore(self, sources: Sources, bf: models.BeancountFile) -> bool:
+        self.sources = sources
+        self.settings.get_loader().share(bf)
+        return True
@@ -1,6 +1,5 @@
 from app.core import base
 from bdantic import models
-from beancount import loader
 from loguru import logger
 from pydantic import BaseModel
 
@@ -65,8 +64,8 @@ class RedisStorage(base.BaseStorage):
                     "Redis returned no data with the configured key"
                 )
 
-            return models.BeancountFile.parse(
-                loader.load_string(contents.decode("utf-8"))
+            return self.settings.get_loader().from_string(
+                contents.decode("utf-8")
             )
 
     def changed(self, _: models.BeancountFile) -> bool:
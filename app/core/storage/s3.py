@@ -3,7 +3,7 @@ from pathlib import Path
 from typing import Any
 
 import boto3  # type: ignore
-from app.core import base, beancount
+from app.core import base
 from bdantic import models
 from loguru import logger
 from pydantic import BaseModel
@@ -55,7 +55,7 @@ class S3Storage(base.BaseStorage):
             self._download(object.key)
 
         logger.info(f"Loading data from {self.settings.entry_path()}")
-        return beancount.from_file(self.settings.entry_path())
+        return self.settings.get_loader().from_file(self.settings.entry_path())
 
     def changed(self, _: models.BeancountFile) -> bool:
         # TODO: Add support for cache invalidation
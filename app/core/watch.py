@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import functools
+import os
+import re
+import struct
+from typing import Iterable
+
+# Flags and event masks from <sys/inotify.h>
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+
+_DIR_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+_FILE_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+_EVENT = struct.Struct("iIII")
+
+# Matches the wildcards of glob patterns
+_MAGIC = re.compile(r"[*?[]")
+
+
+class Watcher:
+    """Watches a set of files for changes using inotify.
+
+    Both the files themselves and their parent directories are watched. The
+    former catches in-place edits (including to symlinked files) while the
+    latter catches editors which save by writing a temporary file and renaming
+    it over the original. Bursts of events are debounced so that a single call
+    to `wait` returns only after writes have settled.
+
+    Files which don't exist yet can be watched for by glob patterns. The
+    deepest directory of each pattern without wildcards is watched, and files
+    created in or moved into it which match the pattern are changes. Files
+    created in subdirectories of that directory aren't noticed.
+
+    Attributes:
+        paths: The sorted list of file paths being watched.
+        patterns: The sorted list of glob patterns being watched.
+        debounce: Seconds without events required before `wait` returns.
+    """
+
+    paths: list[str]
+    patterns: list[str]
+    debounce: float
+
+    def __init__(
+        self,
+        paths: Iterable[str],
+        debounce: float = 0.5,
+        patterns: Iterable[str] = (),
+    ):
+        """Starts watching the given files.
+
+        Args:
+            paths: The paths of the files to watch.
+            debounce: Seconds without events required before `wait` returns.
+            patterns: Glob patterns of new files to watch for.
+
+        Raises:
+            OSError: If inotify is unavailable or a watch can't be added.
+        """
+        self.paths = sorted(set(paths))
+        self.patterns = sorted(set(patterns))
+        self.debounce = debounce
+
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._fd = _inotify_init()
+        self._dirs: dict[int, set[str]] = {}
+        self._files: set[int] = set()
+        self._globs: dict[int, tuple[str, list[str]]] = {}
+
+        try:
+            dirs: dict[str, set[str]] = {}
+            for path in self.paths:
+                name = os.path.basename(path)
+                dirs.setdefault(os.path.dirname(path), set()).add(name)
+                if os.path.exists(path):
+                    self._files.add(_add_watch(self._fd, path, _FILE_MASK))
+
+            for dir, names in dirs.items():
+                wd = _add_watch(self._fd, dir, _DIR_MASK)
+                self._dirs.setdefault(wd, set()).update(names)
+
+            for pattern in self.patterns:
+                dir = _base(pattern)
+                if os.path.isdir(dir):
+                    wd = _add_watch(self._fd, dir, _DIR_MASK)
+                    self._globs.setdefault(wd, (dir, []))[1].append(pattern)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+        self._loop.add_reader(self._fd, self._read)
+
+    async def wait(self) -> None:
+        """Waits for one of the watched files to change.
+
+        Returns once at least one relevant event was received and no further
+        events arrived for `debounce` seconds.
+        """
+        await self._event.wait()
+        while True:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), self.debounce)
+            except asyncio.TimeoutError:
+                return
+
+    def close(self) -> None:
+        """Stops watching and releases the inotify file descriptor."""
+        if self._fd >= 0:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+
+    def _read(self) -> None:
+        """Drains pending inotify events and flags relevant ones."""
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+            start, offset = offset + _EVENT.size, offset + _EVENT.size + length
+            name = os.fsdecode(buf[start:offset].rstrip(b"\0"))
+
+            if self._relevant(wd, mask, name):
+                self._event.set()
+
+    def _relevant(self, wd: int, mask: int, name: str) -> bool:
+        """Returns if the given event concerns one of the watched files.
+
+        Args:
+            wd: The watch descriptor the event was generated for.
+            mask: The event mask.
+            name: The name of the file for events on directories.
+
+        Returns:
+            True if the event is relevant, False otherwise.
+        """
+        if mask & IN_Q_OVERFLOW or wd in self._files:
+            return True
+        elif name in self._dirs.get(wd, ()):
+            return True
+        elif wd not in self._globs or not mask & (IN_CREATE | IN_MOVED_TO):
+            return False
+
+        dir, patterns = self._globs[wd]
+        return any(_match(os.path.join(dir, name), p) for p in patterns)
+
+
+def _base(pattern: str) -> str:
+    """Returns the deepest directory of a glob pattern without wildcards.
+
+    Args:
+        pattern: The glob pattern.
+
+    Returns:
+        The path of the directory.
+    """
+    dir = os.path.dirname(pattern)
+    while _MAGIC.search(dir):
+        dir = os.path.dirname(dir)
+
+    return dir
+
+
+def _match(path: str, pattern: str) -> bool:
+    """Returns if a path matches a glob pattern.
+
+    Recursive wildcards (`**`) also match no directories at all, like they do
+    for `glob.glob`.
+
+    Args:
+        path: The path to match.
+        pattern: The glob pattern.
+
+    Returns:
+        True if the path matches, False otherwise.
+    """
+    return fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(
+        path, pattern.replace("**" + os.sep, "")
+    )
+
+
+def _inotify_init() -> int:
+    """Creates a new non-blocking inotify instance.
+
+    Raises:
+        OSError: If inotify is unavailable.
+
+    Returns:
+        The inotify file descriptor.
+    """
+    try:
+        fd = _libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except AttributeError:
+        raise OSError("inotify is not supported on this platform")
+
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    return fd
+
+
+def _add_watch(fd: int, path: str, mask: int) -> int:
+    """Adds a watch for the given path to an inotify instance.
+
+    Args:
+        fd: The inotify file descriptor.
+        path: The path to watch.
+        mask: The events to watch for.
+
+    Raises:
+        OSError: If the watch could not be added.
+
+    Returns:
+        The watch descriptor.
+    """
+    wd = _libc().inotify_add_watch(fd, os.fsencode(path), mask)
+    if wd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+    return wd
+
+
+@functools.cache
+def _libc() -> ctypes.CDLL:
+    """Returns a handle to the C library.
+
+    Returns:
+        The C library.
+    """
+    return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
@@ -1,14 +1,13 @@
 import asyncio
 
 from fastapi import Depends, FastAPI
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from jmespath.exceptions import LexerError  # type: ignore
 from loguru import logger
 
-from app.api import deps
+from app.api import deps, responses
 from app.api.v1 import api
-from app.core import cache, logging, settings
+from app.core import cache, logging, persist, settings
 
 # Create app
 app = FastAPI(
@@ -34,8 +33,15 @@ async def startup():
 
     # Retrieve settings and setup cache
     app.state.settings = settings.Settings()
+    store = None
+    if app.state.settings.cache_persist:
+        store = persist.SnapshotStore(app.state.settings.snapshot_path())
+
     app.state.cache = cache.Cache(
-        app.state.settings.get_storage(), app.state.settings.cache_interval
+        app.state.settings.get_storage(),
+        app.state.settings.cache_interval,
+        app.state.settings.cache_watch,
+        store,
     )
 
     # Run cache background task
@@ -49,13 +55,19 @@ async def startup():
         app.router.dependencies.append(Depends(deps.authenticated))
 
     # Add middleware
-    app.add_middleware(GZipMiddleware)
+    app.add_middleware(responses.CompressionMiddleware)
 
     # Add routes
     logger.info("Configuring routes")
     app.include_router(api.router, prefix=f"/{app.state.settings.version}")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Shutdown handler for releasing dependencies."""
+    app.state.settings.get_loader().close()
+
+
 # Exception handlers
 
 
@@ -0,0 +1,175 @@
+import gzip
+import json
+from unittest import mock
+
+import pytest
+from app.api import deps, responses
+from app.core import cache
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def _request(path: str, query: str = "", encoding: str = "") -> Request:
+    headers = [(b"accept-encoding", encoding.encode())] if encoding else []
+    return Request(
+        {
+            "type": "http",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": headers,
+        }
+    )
+
+
+def test_encode(beanfile):
+    expected = jsonable_encoder(beanfile, exclude_none=True, by_alias=True)
+    assert json.loads(responses.encode(beanfile)) == expected
+
+
+def test_project(beanfile):
+    fields = deps.get_fields("date, postings.account,postings.units.number")
+    assert fields == {
+        "date": None,
+        "postings": {"account": None, "units": {"number": None}},
+    }
+    assert deps.get_fields("postings.units,postings") == {"postings": None}
+
+    expected = []
+    for entry in jsonable_encoder(beanfile.entries, exclude_none=True):
+        projected = {"date": entry["date"]}
+        if "postings" in entry:
+            projected["postings"] = [
+                {
+                    "account": p["account"],
+                    "units": {"number": p["units"]["number"]},
+                }
+                for p in entry["postings"]
+            ]
+        expected.append(projected)
+
+    assert json.loads(responses.encode(beanfile.entries, fields)) == expected
+
+    # Missing fields are left out
+    assert responses.project(beanfile.accounts, {"missing": None}) == {}
+
+
+@pytest.mark.parametrize("fields", ["date,", "postings..units", ".date"])
+def test_project_invalid(fields):
+    with pytest.raises(HTTPException):
+        deps.get_fields(fields)
+
+
+@pytest.mark.anyio
+async def test_cached(beanfile):
+    snapshot = cache.Snapshot(beanfile)
+    build = mock.Mock(return_value=beanfile.accounts)
+
+    first = await responses.cached(_request("/account"), snapshot, build)
+    second = await responses.cached(_request("/account"), snapshot, build)
+    assert first.body == second.body == responses.encode(beanfile.accounts)
+    assert first.media_type == "application/json"
+    build.assert_called_once()
+
+    # Requests with parameters are encoded every time
+    request = _request("/account", "limit=1")
+    response = await responses.cached(request, snapshot, build)
+    assert isinstance(response, responses.ModelResponse)
+    assert response.body == first.body
+    assert build.call_count == 2
+
+    # A new snapshot encodes its own responses
+    assert not cache.Snapshot(beanfile).responses
+
+
+@pytest.mark.anyio
+async def test_cached_compressed(beanfile):
+    snapshot = cache.Snapshot(beanfile)
+    build = mock.Mock(return_value=beanfile.accounts)
+    body = responses.encode(beanfile.accounts)
+
+    request = _request("/account", encoding="gzip, deflate")
+    with mock.patch.dict(
+        responses._COMPRESSORS, {"gzip": mock.Mock(return_value=b"gz")}
+    ) as compressors:
+        first = await responses.cached(request, snapshot, build)
+        second = await responses.cached(request, snapshot, build)
+        assert first.body == second.body == b"gz"
+        compressors["gzip"].assert_called_once_with(body)
+
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert first.headers["Vary"] == "Accept-Encoding"
+    assert snapshot.responses[("/account", "gzip")] == b"gz"
+
+    # Requests not accepting any encoding get the uncompressed response
+    request = _request("/account", encoding="gzip;q=0")
+    response = await responses.cached(request, snapshot, build)
+    assert response.body == body
+    assert "Content-Encoding" not in response.headers
+
+    # Small responses aren't compressed at all
+    with mock.patch.object(responses, "_MIN_COMPRESS_SIZE", len(body) + 1):
+        request = _request("/account", encoding="gzip")
+        response = await responses.cached(request, snapshot, build)
+        assert response.body == body
+    build.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "encoding,expected",
+    [
+        ("", None),
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("gzip, br;q=0.5", "gzip"),
+        ("br;q=0, zstd;q=0", None),
+        ("*", "br"),
+        ("*, br;q=0", "zstd"),
+        ("identity", None),
+    ],
+)
+def test_negotiate(encoding, expected):
+    compressors = {"br": bytes, "zstd": bytes, "gzip": bytes}
+    with mock.patch.dict(responses._COMPRESSORS, compressors, clear=True):
+        request = _request("/", encoding=encoding)
+        assert responses._negotiate(request) == expected
+
+
+def test_compression_middleware():
+    body = b"{}" * responses._MIN_COMPRESS_SIZE
+    app = FastAPI()
+    app.add_middleware(responses.CompressionMiddleware)
+
+    @app.get("/compressed")
+    def compressed():
+        return Response(
+            gzip.compress(body), headers={"Content-Encoding": "gzip"}
+        )
+
+    @app.get("/plain")
+    def plain():
+        return Response(body)
+
+    # Compressed responses are passed through instead of compressed again
+    client = TestClient(app)
+    response = client.get("/compressed")
+    assert response.content == body
+
+    response = client.get("/plain")
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.content == body
+
+
+def test_lines(beanfile):
+    entries = beanfile.entries[:]
+    with mock.patch.object(responses, "_CHUNK_SIZE", 1):
+        chunks = list(responses._lines(entries))
+
+    assert len(chunks) == len(entries)
+    assert chunks[0] == responses.encode(entries[0]) + b"\n"
+    assert b"".join(responses._lines(entries)) == b"".join(chunks)
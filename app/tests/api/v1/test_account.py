@@ -48,5 +48,15 @@ def test_transactions(client: TestClient, raw_accounts, raw_entries):
     assert response.status_code == 200
     assert response.json() == expected
 
+    pages = []
+    params = {"limit": 1}
+    while True:
+        response = client.get(f"/account/{name}/transactions", params=params)
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert pages == [[t] for t in expected]
+
     response = client.get(f"/account/{name}123/transactions")
     assert response.status_code == 404
@@ -1,4 +1,11 @@
+import json
+from datetime import date, timedelta
+from typing import cast
+from unittest import mock
+
 from app.api import deps
+from app.core import cache
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 
@@ -21,6 +28,9 @@ def test_directive_id(client: TestClient, raw_entries):
         response = client.get(f"/directive/id/{entry['id']}")
         assert response.json() == entry
 
+    response = client.get("/directive/id/missing")
+    assert response.status_code == 404
+
 
 def test_directive_syntax(
     client: TestClient, syntax: dict[str, tuple[dict, str]]
@@ -28,3 +38,164 @@ def test_directive_syntax(
     for v in syntax.values():
         response = client.post("/directive/syntax", json=v[0])
         assert response.text == v[1]
+
+
+def test_directive_ids(client: TestClient, raw_entries):
+    ids = [e["id"] for e in reversed(raw_entries)]
+    response = client.post("/directive/ids", json=ids)
+    assert response.json() == list(reversed(raw_entries))
+
+    response = client.post("/directive/ids", json=[ids[0], "missing"])
+    assert response.status_code == 404
+
+
+def test_directive_dates(client: TestClient, raw_entries):
+    today = date.today()
+    for query, expected in [
+        (f"start={today}", raw_entries),
+        (f"start={today + timedelta(days=1)}", []),
+        (f"end={today}", []),
+        (f"end={today + timedelta(days=1)}", raw_entries),
+    ]:
+        response = client.get(f"/directive?{query}")
+        assert response.json() == expected
+
+    response = client.get(f"/directive/transaction?end={today}")
+    assert response.json() == []
+
+
+def test_directive_search(client: TestClient, raw_entries):
+    expected = [e for e in raw_entries if e.get("payee") == "Safeway"]
+    response = client.get("/directive?search=safeway")
+    assert response.json() == expected
+
+    response = client.get("/directive/transaction?search=safeway")
+    assert response.json() == expected
+
+    response = client.get("/directive/open?search=safeway")
+    assert response.json() == []
+
+
+def test_directive_ranked(client: TestClient, raw_entries):
+    expected = [e for e in raw_entries if e.get("payee") == "Safeway"]
+    response = client.get("/directive?search=safe&search_mode=ranked")
+    assert response.json() == expected
+
+    response = client.get("/directive?limit=2")
+    assert response.json() == raw_entries[:2]
+
+    response = client.get("/directive?limit=0")
+    assert response.status_code == 422
+
+
+def test_directive_cursor(client: TestClient, raw_entries):
+    pages = []
+    params = {"limit": 3}
+    while True:
+        response = client.get("/directive", params=params)
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert len(pages) == -(-len(raw_entries) // 3)
+    assert sum(pages, []) == raw_entries
+
+    # Cursors are only valid for the query which issued them
+    cursor = client.get("/directive?limit=1").headers["X-Next-Cursor"]
+    response = client.get("/directive/open", params={"cursor": cursor})
+    assert response.status_code == 400
+    response = client.get("/directive", params={"cursor": cursor})
+    assert response.json() == raw_entries[1:]
+
+    # Reloading the same contents keeps cursors valid, changing them doesn't
+    overrides = cast(FastAPI, client.app).dependency_overrides
+    snapshot = overrides[deps.get_snapshot]()
+    beanfile = snapshot.beanfile.copy()
+    overrides[deps.get_snapshot] = lambda: (
+        cache.Snapshot(beanfile, snapshot.generation + 1)
+    )
+    response = client.get("/directive", params={"cursor": cursor})
+    assert response.status_code == 200
+
+    beanfile.errors = ["error"]
+    response = client.get("/directive", params={"cursor": cursor})
+    assert response.status_code == 410
+
+    response = client.get("/directive", params={"cursor": "invalid"})
+    assert response.status_code == 400
+
+
+def test_directive_fields(client: TestClient, raw_entries):
+    expected = [
+        {"date": e["date"], "narration": e["narration"]}
+        for e in raw_entries
+        if e["ty"] == "Transaction"
+    ]
+    response = client.get(
+        "/directive/transaction", params={"fields": "date,narration"}
+    )
+    assert response.json() == expected
+
+    response = client.get(
+        "/directive",
+        params={"fields": "date,narration", "format": "ndjson", "limit": 1},
+    )
+    assert json.loads(response.text) == {"date": raw_entries[0]["date"]}
+
+
+def test_directive_conditional(client: TestClient):
+    params = {"search": "safeway", "limit": 1}
+    etag = client.get("/directive", params=params).headers["ETag"]
+
+    # Matching requests are answered before the directives are mutated,
+    # regardless of the order of their query parameters
+    with mock.patch("app.core.mutate.DirectivesMutator.page") as page:
+        response = client.get(
+            "/directive",
+            params=dict(reversed(params.items())),
+            headers={"If-None-Match": f'"other", {etag}'},
+        )
+        assert response.status_code == 304
+        page.assert_not_called()
+
+    response = client.get("/directive", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    response = client.post("/directive/ids", json=[])
+    assert "ETag" not in response.headers
+
+
+def test_directive_id_unvalidated(client: TestClient, raw_entries):
+    expected = raw_entries[0]
+
+    # Snapshot models are encoded without being validated again
+    with mock.patch(
+        "fastapi.routing.serialize_response"
+    ) as serialize_response:
+        response = client.get(f"/directive/id/{expected['id']}")
+        assert response.json() == expected
+        serialize_response.assert_not_called()
+
+
+def test_directives_ndjson(client: TestClient, raw_entries):
+    response = client.get("/directive", params={"format": "ndjson"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == (
+        raw_entries
+    )
+
+    # Negotiated through the Accept header
+    response = client.get(
+        "/directive/open", headers={"Accept": "application/x-ndjson"}
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        e for e in raw_entries if e["ty"] == "Open"
+    ]
+
+    response = client.get(
+        "/directive/open",
+        params={"format": "json"},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.headers["content-type"] == "application/json"
@@ -1,3 +1,9 @@
+import json
+from typing import cast
+
+from app.api import deps
+from app.core import cache
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 
@@ -14,3 +20,42 @@ def test_errors(client: TestClient):
 def test_options(client: TestClient, raw_options):
     response = client.get("/file/options")
     assert response.json() == raw_options
+
+
+def test_file_ndjson(client: TestClient, raw_file):
+    response = client.get("/file", params={"format": "ndjson"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {k: v for k, v in raw_file.items() if k != "entries"}
+    assert lines[1:] == raw_file["entries"]
+
+
+def test_file_conditional(client: TestClient):
+    response = client.get("/file")
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/file", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    # Tags depend on the path and query parameters
+    response = client.get("/file", params={"format": "ndjson"})
+    assert response.headers["ETag"] != etag
+    assert client.get("/account").headers["ETag"] != etag
+
+    # Reloading the same contents keeps the tags, changing them doesn't
+    overrides = cast(FastAPI, client.app).dependency_overrides
+    snapshot = overrides[deps.get_snapshot]()
+    beanfile = snapshot.beanfile.copy()
+    overrides[deps.get_snapshot] = lambda: (
+        cache.Snapshot(beanfile, snapshot.generation + 1)
+    )
+    response = client.get("/file", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    beanfile.errors = ["error"]
+    response = client.get("/file", headers={"If-None-Match": etag})
+    assert response.status_code == 200
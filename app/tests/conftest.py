@@ -7,6 +7,7 @@ from decimal import Decimal
 import pytest
 from app.api import deps
 from app.api.v1 import api
+from app.core import cache
 from bdantic import models
 from bdantic.types import ModelDirective
 from fastapi import FastAPI
@@ -17,7 +18,8 @@ from fastapi.testclient import TestClient
 def client() -> TestClient:
     app = FastAPI()
     app.include_router(api.router)
-    app.dependency_overrides[deps.get_beanfile] = _generate_beanfile
+    snapshot = cache.Snapshot(_generate_beanfile())
+    app.dependency_overrides[deps.get_snapshot] = lambda: snapshot
 
     return TestClient(app)
 
@@ -0,0 +1,106 @@
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import beancount, settings
+from app.core.loader.process import ProcessLoader
+from app.core.loader.thread import ThreadLoader
+
+LEDGER = """
+2022-01-01 open Assets:Bank USD
+2022-01-01 open Expenses:Food USD
+
+2022-01-02 * "Safeway" "Milk"
+  Assets:Bank   -2.99 USD
+  Expenses:Food
+"""
+
+
+def test_from_file(tmp_path):
+    (tmp_path / "main.beancount").write_text(LEDGER)
+    stgs = settings.Settings(
+        work_dir=str(tmp_path), loader=settings.Loader.process
+    )
+
+    loader = stgs.get_loader()
+    assert isinstance(loader, ProcessLoader)
+    try:
+        result = loader.from_file(stgs.entry_path())
+        expected = ThreadLoader(stgs).from_file(stgs.entry_path())
+        assert result.entries == expected.entries
+        assert result.accounts == expected.accounts
+
+        result = loader.from_string(LEDGER)
+        assert len(result.entries) == 3
+
+        # Unchanged directives are shared with the previous load
+        second = loader.from_string(LEDGER.replace("2.99", "3.99"))
+        assert second.entries[0] is result.entries[0]
+        assert second.entries[2] is not result.entries[2]
+    finally:
+        loader.close()
+
+    assert loader.executor is None
+
+
+def test_broken_pool(tmp_path):
+    stgs = settings.Settings(
+        work_dir=str(tmp_path), loader=settings.Loader.process
+    )
+
+    loader = stgs.get_loader()
+    assert isinstance(loader, ProcessLoader)
+    try:
+        assert len(loader.from_string(LEDGER).entries) == 3
+        executor = loader.executor
+        assert executor is not None
+
+        # A pool broken by a dying worker is replaced
+        for pid in executor._processes:
+            os.kill(pid, signal.SIGKILL)
+        assert len(loader.from_string(LEDGER).entries) == 3
+        assert loader.executor is not executor
+    finally:
+        loader.close()
+
+
+def test_from_file_lazy(tmp_path):
+    (tmp_path / "main.beancount").write_text(LEDGER)
+    stgs = settings.Settings(
+        work_dir=str(tmp_path),
+        loader=settings.Loader.process,
+        loader_lazy=True,
+    )
+
+    loader = stgs.get_loader()
+    try:
+        result = loader.from_file(stgs.entry_path())
+        assert result.entries.__root__.materialized == 0
+        assert result.entries == (
+            ThreadLoader(stgs).from_file(stgs.entry_path()).entries
+        )
+    finally:
+        loader.close()
+
+
+def test_close_converters(tmp_path):
+    count = 2 * beancount._MIN_CHUNK
+    (tmp_path / "main.beancount").write_text(
+        "".join(f"2022-01-01 open Assets:Bank{i}\n" for i in range(count))
+    )
+    stgs = settings.Settings(
+        work_dir=str(tmp_path),
+        loader=settings.Loader.process,
+        loader_convert_workers=2,
+    )
+
+    # Workers shut down the processes they converted the entries with
+    loader = stgs.get_loader()
+    try:
+        assert len(loader.from_file(stgs.entry_path()).entries) == count
+    finally:
+        pool = ThreadPoolExecutor(1)
+        try:
+            pool.submit(loader.close).result(timeout=30)
+        finally:
+            pool.shutdown(wait=False)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+from unittest import mock
+
+import pytest
+from app.core import settings
+from app.core.storage.local import LocalStorage
+
+
+def test_changed(tmp_path):
+    (tmp_path / "main.beancount").write_text('include "accounts.beancount"\n')
+    (tmp_path / "accounts.beancount").write_text(
+        "2022-01-01 open Assets:Bank USD\n"
+    )
+
+    storage = LocalStorage(settings.Settings(work_dir=str(tmp_path)))
+    bf = storage.load()
+
+    assert storage.sources is not None
+    assert len(storage.sources.paths) == 2
+    assert not storage.changed(bf)
+
+    (tmp_path / "accounts.beancount").write_text(
+        "2022-01-01 open Assets:Cash USD\n"
+    )
+    assert storage.changed(bf)
+
+
+def test_changed_glob(tmp_path):
+    (tmp_path / "main.beancount").write_text('include "txns/*.beancount"\n')
+    (tmp_path / "txns").mkdir()
+    (tmp_path / "txns" / "2021.beancount").write_text(
+        "2021-01-01 open Assets:Bank USD\n"
+    )
+
+    storage = LocalStorage(settings.Settings(work_dir=str(tmp_path)))
+    bf = storage.load()
+    assert not storage.changed(bf)
+
+    # New files matching a glob include are picked up by the next load
+    (tmp_path / "txns" / "2022.beancount").write_text(
+        "2022-01-01 open Assets:Cash USD\n"
+    )
+    assert storage.changed(bf)
+    assert len(storage.load().entries) == 2
+    assert storage.sources is not None
+    assert len(storage.sources.paths) == 3
+
+
+def test_changed_while_loading(tmp_path):
+    main = tmp_path / "main.beancount"
+    main.write_text('include "accounts.beancount"\n')
+    accounts = tmp_path / "accounts.beancount"
+    accounts.write_text("2022-01-01 open Assets:Bank USD\n")
+
+    storage = LocalStorage(settings.Settings(work_dir=str(tmp_path)))
+    assert storage.changed(None)
+
+    bf = storage.load()
+    loader = storage.settings.get_loader()
+    parse = loader.from_file
+
+    def edited(path: str, write: str):
+        # Saves a file after it was parsed, but before loading finished
+        def from_file(*args):
+            result = parse(*args)
+            (tmp_path / path).write_text(write)
+            return result
+
+        return from_file
+
+    # Changes to files which remain included are detected
+    with mock.patch.object(
+        type(loader),
+        "from_file",
+        side_effect=edited(
+            "accounts.beancount", "2022-01-01 open Assets:Cash USD\n"
+        ),
+    ):
+        bf = storage.load()
+    assert storage.changed(bf)
+
+    # As are changes to files which were included before
+    (tmp_path / "other.beancount").write_text("")
+    main.write_text('include "other.beancount"\n')
+    storage.load()
+    main.write_text('include "accounts.beancount"\n')
+    with mock.patch.object(
+        type(loader),
+        "from_file",
+        side_effect=edited("other.beancount", "; changed\n"),
+    ):
+        bf = storage.load()
+    assert storage.changed(bf)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_wait(tmp_path):
+    (tmp_path / "main.beancount").write_text("2022-01-01 open Assets:Bank\n")
+
+    stgs = settings.Settings(work_dir=str(tmp_path), cache_debounce=0.05)
+    storage = LocalStorage(stgs)
+    storage.load()
+
+    task = asyncio.create_task(storage.wait())
+    await asyncio.sleep(0.1)
+    assert not task.done()
+
+    # Touching the file doesn't change its contents
+    os.utime(tmp_path / "main.beancount")
+    await asyncio.sleep(0.2)
+    assert not task.done()
+
+    (tmp_path / "main.beancount").write_text("2022-01-01 open Assets:Cash\n")
+    await asyncio.wait_for(task, 1)
+
+    assert storage.watcher is not None
+    storage.watcher.close()
+
+
+@pytest.mark.anyio
+async def test_wait_glob(tmp_path):
+    (tmp_path / "main.beancount").write_text('include "txns/*.beancount"\n')
+    (tmp_path / "txns").mkdir()
+
+    stgs = settings.Settings(work_dir=str(tmp_path), cache_debounce=0.05)
+    storage = LocalStorage(stgs)
+    storage.load()
+
+    task = asyncio.create_task(storage.wait())
+    await asyncio.sleep(0.1)
+    assert not task.done()
+
+    # New files matching a glob include are changes
+    (tmp_path / "txns" / "2022.beancount").write_text("")
+    await asyncio.wait_for(task, 1)
+
+    assert storage.watcher is not None
+    storage.watcher.close()
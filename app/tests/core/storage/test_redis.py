@@ -6,7 +6,7 @@ from app.core.storage.redis import RedisConfig, RedisStorage
 import redis
 
 
-@mock.patch("bdantic.models.BeancountFile.parse")
+@mock.patch("app.core.beancount._parse")
 @mock.patch("bdantic.models.BeancountFile.decompress")
 @mock.patch("beancount.loader.load_string")
 @mock.patch("redis.StrictRedis.pubsub")
@@ -29,7 +29,7 @@ def test_load(get, pubsub, loader, decompress, parse):
     ps.subscribe.assert_called_once_with(stgs.redis.channel)
     get.assert_called_once_with(stgs.redis.key)
     loader.assert_called_once_with("test")
-    parse.assert_called_once_with(contents)
+    parse.assert_called_once_with(contents, False, 1)
 
     # Cached
     get.return_value = "bytes"
@@ -0,0 +1,242 @@
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from app.core import beancount
+from bdantic import models
+
+from beancount import loader
+
+MAIN = """
+option "operating_currency" "USD"
+include "accounts.beancount"
+include "txns/*.beancount"
+"""
+
+ACCOUNTS = """
+2022-01-01 open Assets:Bank USD
+2022-01-01 open Equity:Opening USD
+2022-01-01 open Expenses:Food USD
+2022-01-01 pad Assets:Bank Equity:Opening
+2022-01-02 balance Assets:Bank 100.00 USD
+"""
+
+JANUARY = """
+2022-01-05 * "Safeway" "Milk"
+  Assets:Bank   -2.99 USD
+  Expenses:Food
+"""
+
+FEBRUARY = """
+2022-02-05 * "Safeway" "Eggs" #food
+  Assets:Bank   -4.99 USD
+  Expenses:Food
+"""
+
+
+def _expected(path: str) -> models.BeancountFile:
+    return models.BeancountFile.parse(loader.load_file(path))
+
+
+def test_incremental_loader(tmp_path):
+    (tmp_path / "txns").mkdir()
+    (tmp_path / "main.beancount").write_text(MAIN)
+    (tmp_path / "accounts.beancount").write_text(ACCOUNTS)
+    (tmp_path / "txns" / "2022-01.beancount").write_text(JANUARY)
+    (tmp_path / "txns" / "2022-02.beancount").write_text(FEBRUARY)
+    path = str(tmp_path / "main.beancount")
+
+    ldr = beancount.IncrementalLoader()
+    first = ldr.load(path)
+    expected = _expected(path)
+
+    assert first.entries == expected.entries
+    assert first.accounts == expected.accounts
+    assert first.options == expected.options
+    assert len(first.errors) == len(expected.errors) == 0
+
+    # Only the changed file is parsed again
+    (tmp_path / "txns" / "2022-02.beancount").write_text(
+        FEBRUARY.replace("4.99", "5.99")
+    )
+    with mock.patch(
+        "beancount.parser.parser.parse_file", wraps=beancount.parser.parse_file
+    ) as parse_file:
+        second = ldr.load(path)
+        parse_file.assert_called_once()
+        assert parse_file.call_args.kwargs["report_filename"].endswith(
+            "2022-02.beancount"
+        )
+
+    expected = _expected(path)
+    assert second.entries == expected.entries
+    assert second.accounts == expected.accounts
+
+    # Models of unchanged entries are reused
+    january = [
+        (a, b)
+        for a, b in zip(first.entries, second.entries)
+        if isinstance(a, models.Transaction) and a.narration == "Milk"
+    ]
+    assert len(january) == 1
+    assert january[0][0] is january[0][1]
+
+    eggs = [
+        t
+        for t in second.entries.by_type(models.Transaction)
+        if t.narration == "Eggs"
+    ]
+    assert eggs[0] not in first.entries
+
+
+def test_incremental_loader_errors(tmp_path):
+    (tmp_path / "main.beancount").write_text('include "missing.beancount"\n')
+
+    bf = beancount.from_file(str(tmp_path / "main.beancount"), True)
+    assert len(bf.errors) == len(
+        _expected(str(tmp_path / "main.beancount")).errors
+    )
+
+
+def test_incremental_loader_options(tmp_path):
+    (tmp_path / "main.beancount").write_text(MAIN)
+    (tmp_path / "accounts.beancount").write_text(ACCOUNTS)
+    path = str(tmp_path / "main.beancount")
+
+    ldr = beancount.IncrementalLoader()
+    first = ldr.load(path)
+
+    # Changing the options invalidates all models
+    (tmp_path / "main.beancount").write_text(
+        MAIN + 'option "inferred_tolerance_multiplier" "1.1"\n'
+    )
+    second = ldr.load(path)
+    assert second.entries == _expected(path).entries
+    assert not any(a is b for a, b in zip(first.entries, second.entries))
+
+
+def test_lazy(tmp_path):
+    (tmp_path / "main.beancount").write_text(ACCOUNTS + JANUARY)
+    path = str(tmp_path / "main.beancount")
+    expected = _expected(path)
+
+    for incremental in (False, True):
+        bf = beancount.from_file(path, incremental, lazy=True)
+        entries = bf.entries.__root__
+        assert isinstance(entries, beancount.LazyDirectives)
+        assert entries.materialized == 0
+        assert bf.accounts == expected.accounts
+
+        # Only the accessed entries are converted, and only once
+        assert bf.entries[-1] == expected.entries[-1]
+        assert bf.entries[-1] is bf.entries[-1]
+        assert entries.materialized == 1
+
+        # Lazily converted models aren't pickled
+        restored = beancount.loads(beancount.dumps(bf))
+        assert restored.entries.__root__.materialized == 0
+
+        assert bf.entries == expected.entries
+        assert restored.entries == expected.entries
+        assert entries.materialized == len(entries)
+
+
+def test_directive_id():
+    entries, _, _ = loader.load_string(ACCOUNTS)
+    expected = models.Directives.parse(entries)
+
+    assert [beancount.directive_id(e) for e in entries] == [
+        d.id for d in expected
+    ]
+
+
+def test_digest():
+    ledger = '2022-01-05 * "Milk" #a #b #c #d ^x ^y ^z\n  meta1: "1"\n'
+    code = (
+        "from app.core import beancount\n"
+        "from beancount import loader\n"
+        f"entries, _, _ = loader.load_string({ledger!r})\n"
+        "print(beancount.digest(entries[0]).hex())\n"
+    )
+
+    # The digest doesn't depend on the hash seed of the process
+    digests = set()
+    for seed in ("1", "2", "3"):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            text=True,
+        )
+        digests.add(result.stdout.strip())
+
+    entries, _, _ = loader.load_string(ledger)
+    assert digests == {beancount.digest(entries[0]).hex()}
+
+
+def test_convert(tmp_path):
+    (tmp_path / "main.beancount").write_text(ACCOUNTS + JANUARY + FEBRUARY)
+    path = str(tmp_path / "main.beancount")
+    expected = _expected(path)
+    entries, _, _ = loader.load_file(path)
+
+    # Too few entries to be worth converting in parallel
+    assert beancount.convert(entries, 2) == expected.entries[:]
+    assert not beancount._pools
+
+    try:
+        with mock.patch.object(beancount, "_MIN_CHUNK", 2):
+            assert beancount.convert(entries, 2) == expected.entries[:]
+            assert 2 in beancount._pools
+
+            for incremental in (False, True):
+                bf = beancount.from_file(path, incremental, workers=2)
+                assert bf.entries == expected.entries
+                assert bf.accounts == expected.accounts
+    finally:
+        beancount.shutdown()
+
+    assert not beancount._pools
+
+
+def test_model_cache():
+    entries, _, _ = loader.load_string(ACCOUNTS + JANUARY)
+    cache = beancount.ModelCache()
+
+    first = cache.convert(entries)
+    assert first == models.Directives.parse(entries)[:]
+    assert len(cache.known()) == len(entries)
+
+    # Unchanged entries are shared, changed ones are converted again
+    changed, _, _ = loader.load_string(ACCOUNTS + JANUARY.replace("2.99", "3"))
+    second = cache.convert(changed)
+    shared = [a is b for a, b in zip(first, second)]
+    assert shared == [True] * (len(entries) - 1) + [False]
+
+    # Lazily converted directives are shared once they have been converted
+    third = cache.convert(changed, lazy=True)
+    assert third.materialized == len(entries)
+    assert third[-1] is second[-1]
+
+    cache.convert(entries, lazy=True)
+    fourth = cache.convert(entries, lazy=True)
+    assert fourth.materialized == len(entries) - 1
+    assert fourth[0] is first[0]
+
+
+def test_dumps_known():
+    entries, errors, options = loader.load_string(ACCOUNTS + JANUARY)
+    cache = beancount.ModelCache()
+    bf = beancount._construct(cache.convert(entries), entries, errors, options)
+
+    known = cache.known()
+    full = beancount.dumps(bf)
+    partial = beancount.dumps(bf, known.keys())
+    assert len(partial) < len(full)
+
+    restored = beancount.loads(partial, known)
+    assert all(a is b for a, b in zip(restored.entries, bf.entries))
+    assert restored.entries.__root__.digests == bf.entries.__root__.digests
+    assert beancount.loads(full).entries == bf.entries
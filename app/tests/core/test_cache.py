@@ -0,0 +1,199 @@
+import asyncio
+import pickle
+from unittest import mock
+
+import pytest
+from app.core import base, beancount, cache, persist, settings
+from app.core.storage.local import LocalStorage
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_load(beanfile):
+    storage = mock.Mock(base.BaseStorage)
+    storage.load.return_value = beanfile
+
+    c = cache.Cache(storage)
+    with pytest.raises(LookupError):
+        c.snapshot()
+
+    await c.load()
+    first = c.snapshot()
+    assert first.beanfile == beanfile
+    assert first.generation == 1
+    assert await c.beanfile() is beanfile
+
+    await c.load()
+    assert c.snapshot() is not first
+    assert c.snapshot().generation == 2
+    assert first.generation == 1
+
+
+@pytest.mark.anyio
+async def test_read_during_load(beanfile):
+    storage = mock.Mock(base.BaseStorage)
+    storage.load.return_value = beanfile
+
+    c = cache.Cache(storage)
+    await c.load()
+
+    # Readers must not wait on a reload in progress
+    async with c.lock:
+        assert await c.beanfile() is beanfile
+
+
+@pytest.mark.anyio
+async def test_save(beanfile):
+    storage = mock.Mock(base.BaseStorage)
+    storage.load.return_value = beanfile
+    store = mock.Mock(persist.SnapshotStore("snapshot"))
+
+    # Snapshots are written without holding the reload lock
+    c = cache.Cache(storage, store=store)
+    store.write.side_effect = lambda *_: locked.append(c.lock.locked())
+    locked: list[bool] = []
+    await c.load()
+    assert locked == [False]
+    store.write.assert_called_once_with(
+        c.snapshot(), storage.source_files.return_value
+    )
+
+    # Outdated snapshots are skipped
+    first = c.snapshot()
+    await c.load()
+    await c.save(first, storage.source_files.return_value)
+    assert store.write.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_background_watch(beanfile):
+    storage = mock.Mock(base.BaseStorage)
+    storage.load.side_effect = [beanfile, OSError("missing"), beanfile]
+    storage.wait.side_effect = [None, None, asyncio.CancelledError()]
+
+    # Failed reloads keep watching instead of falling back to polling
+    c = cache.Cache(storage, watch=True)
+    with pytest.raises(asyncio.CancelledError):
+        await c.background()
+    assert storage.load.call_count == 3
+    assert c.snapshot().generation == 2
+    storage.changed.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_restore(tmp_path):
+    (tmp_path / "main.beancount").write_text("2022-01-01 open Assets:Bank\n")
+    stgs = settings.Settings(work_dir=str(tmp_path))
+    store = persist.SnapshotStore(stgs.snapshot_path())
+
+    c = cache.Cache(LocalStorage(stgs), store=store)
+    assert not await c.restore()
+    await c.load()
+
+    # A new cache picks up the persisted snapshot instead of loading
+    storage = LocalStorage(stgs)
+    restored = cache.Cache(storage, store=store)
+    assert await restored.restore()
+    assert restored.snapshot().beanfile == c.snapshot().beanfile
+    assert not storage.changed(restored.snapshot().beanfile)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("loader", list(settings.Loader))
+async def test_restore_shared(tmp_path, loader):
+    (tmp_path / "main.beancount").write_text('include "txns.beancount"\n')
+    txns = tmp_path / "txns.beancount"
+    txns.write_text(
+        "2022-01-01 open Assets:Bank\n2022-01-02 close Assets:Bank\n"
+    )
+    stgs = settings.Settings(work_dir=str(tmp_path), loader=loader)
+    store = persist.SnapshotStore(stgs.snapshot_path())
+    try:
+        await cache.Cache(LocalStorage(stgs), store=store).load()
+    finally:
+        stgs.get_loader().close()
+
+    # Reloading after a restart shares the models of the restored snapshot
+    with mock.patch.object(
+        beancount, "_shared", beancount.ModelCache()
+    ), mock.patch.object(
+        beancount, "_incremental", beancount.IncrementalLoader()
+    ):
+        stgs = settings.Settings(work_dir=str(tmp_path), loader=loader)
+        c = cache.Cache(LocalStorage(stgs), store=store)
+        assert await c.restore()
+        restored = c.snapshot().beanfile.entries
+
+        txns.write_text(
+            "2022-01-01 open Assets:Bank\n2022-01-03 close Assets:Bank\n"
+        )
+        try:
+            await c.load()
+        finally:
+            stgs.get_loader().close()
+
+        entries = c.snapshot().beanfile.entries
+        assert entries[0] is restored[0]
+        assert entries[1] is not restored[1]
+
+
+def test_snapshot_pickle(beanfile):
+    snapshot = cache.Snapshot(beanfile, 2)
+    assert snapshot.view[0]["date"] == beanfile.entries[0].date.isoformat()
+
+    # Lazily built data is rebuilt rather than persisted
+    restored = pickle.loads(pickle.dumps(snapshot))
+    assert "view" not in restored.__dict__
+    assert restored.generation == 2
+    assert list(restored.view) == list(snapshot.view)
+
+
+def test_snapshot_previous(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    ledger.write_text(
+        "2022-01-01 open Assets:Bank\n2022-01-02 close Assets:Bank\n"
+    )
+    first = cache.Snapshot(beancount.from_file(str(ledger)))
+    view = list(first.view)
+
+    # The view of shared directives carries over to the next snapshot
+    ledger.write_text(
+        "2022-01-01 open Assets:Bank\n2022-01-03 close Assets:Bank\n"
+    )
+    second = cache.Snapshot(beancount.from_file(str(ledger)), 1, first)
+    assert second.view[0] is view[0]
+    assert second.view[1] is not view[1]
+    assert second.view[1]["date"] == "2022-01-03"
+
+
+@mock.patch.object(beancount, "_shared", beancount.ModelCache())
+def test_snapshot_view_lazy(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    ledger.write_text(
+        "2022-01-01 open Assets:Bank\n2022-01-02 close Assets:Bank\n"
+    )
+    snapshot = cache.Snapshot(beancount.from_file(str(ledger), lazy=True))
+
+    # Only the accessed parts of the view are built
+    assert snapshot.view[1]["date"] == "2022-01-02"
+    assert len(snapshot.view) == 2
+    assert snapshot.beanfile.entries.__root__.materialized == 1
+
+
+def test_snapshot_digest(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    ledger.write_text("2022-01-01 open Assets:Bank\n")
+    first = cache.Snapshot(beancount.from_file(str(ledger)))
+
+    # The digest only depends on the contents of the ledger
+    assert cache.Snapshot(beancount.from_file(str(ledger)), 1).digest == (
+        first.digest
+    )
+    ledger.write_text("2022-01-01 open Assets:Cash\n")
+    assert cache.Snapshot(beancount.from_file(str(ledger))).digest != (
+        first.digest
+    )
@@ -0,0 +1,96 @@
+from unittest import mock
+
+import pytest
+from app.core import beancount, index
+from bdantic import models
+
+LEDGER = """
+2022-01-01 open Assets:Bank USD
+2022-01-01 open Expenses:Food USD
+2022-01-01 open Equity:Opening USD
+2022-01-01 pad Assets:Bank Equity:Opening
+2022-01-02 balance Assets:Bank 100.00 USD
+
+2022-01-05 * "Safeway" "Milk" #food ^receipt
+  Assets:Bank   -2.99 USD
+  Expenses:Food
+
+2022-01-06 note Assets:Bank "Called the bank"
+"""
+
+
+def test_indexes(entries: models.Directives):
+    indexes = index.Indexes(entries)
+
+    for typ, positions in indexes.types.items():
+        assert [entries[p] for p in positions] == (
+            entries.by_type(typ).__root__
+        )
+
+    for account, positions in indexes.accounts.items():
+        assert [entries[p] for p in positions] == (
+            entries.by_account(account).__root__
+        )
+
+    assert list(indexes.tags["tag1"]) == [
+        i
+        for i, e in enumerate(entries)
+        if "tag1" in (getattr(e, "tags", None) or ())
+    ]
+    assert list(indexes.links["link1"]) == list(indexes.tags["tag1"])
+    assert [entries[p].payee for p in indexes.payees["Safeway"]] == ["Safeway"]
+
+    for positions in indexes.accounts.values():
+        assert list(positions) == sorted(positions)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ([], [1, 2, 3]),
+        ([2], [1, 2, 3]),
+        ([0, 5, 9, 40, 41, 99], list(range(0, 100, 3))),
+        (list(range(0, 1000, 7)), list(range(0, 1000, 5))),
+        ([3, 4, 5], range(4, 10)),
+        (range(2, 8), range(4, 10)),
+    ],
+)
+def test_intersect(a, b):
+    expected = sorted(set(a) & set(b))
+    assert list(index.intersect(index.positions(a), b)) == expected
+    assert list(index.intersect(b, index.positions(a))) == expected
+
+
+def test_intersect_all():
+    sequences = [
+        index.positions(range(0, 100, 2)),
+        index.positions(range(0, 100, 3)),
+        index.positions(range(0, 100, 5)),
+    ]
+    assert list(index.intersect_all(sequences)) == [0, 30, 60, 90]
+    assert list(index.intersect_all(sequences[:1])) == list(sequences[0])
+    assert index.intersect_all(sequences[:1]) is not sequences[0]
+    assert list(index.intersect_all([])) == []
+
+
+@mock.patch.object(beancount, "_shared", beancount.ModelCache())
+def test_indexes_lazy():
+    lazy = beancount.from_string(LEDGER, lazy=True)
+    expected = beancount.from_string(LEDGER)
+
+    indexes = index.Indexes(lazy.entries)
+    assert lazy.entries.__root__.materialized == 0
+
+    other = index.Indexes(expected.entries)
+    for name in ("accounts", "dates", "ids", "payees", "tags", "types"):
+        assert getattr(indexes, name) == getattr(other, name)
+
+
+def test_indexes_without_ids():
+    entries = beancount.from_string(LEDGER).entries
+    entries.__root__[0] = entries[0].copy(update={"id": None})
+
+    # Directives without an ID can't be looked up by it
+    indexes = index.Indexes(entries)
+    assert None not in indexes.ids
+    assert 0 not in indexes.ids.values()
@@ -1,23 +1,236 @@
+import dataclasses
+from datetime import date, timedelta
 from unittest import mock
 
-from app.core import mutate
+import jmespath  # type: ignore
+from app.core import cache, mutate
+from bdantic import models
 
 
-@mock.patch("app.core.search.DirectiveSearcher.search")
-@mock.patch("bdantic.models.file.Directives")
-def test_directives(directives, search):
+@mock.patch("app.core.search.DirectiveSearcher.positions")
+def test_directives(search, beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+
     mut = mutate.DirectivesMutator()
-    result = mut.mutate(directives)
-    assert result == directives
+    result = mut.mutate(snapshot)
+    assert result == beanfile.entries
 
-    directives.filter.return_value = "test"
     mut = mutate.DirectivesMutator(filter_expr="[?ty == 'Open']")
-    result = mut.mutate(directives)
-    assert result == "test"
-    directives.filter.assert_called_once_with("[?ty == 'Open']")
+    result = mut.mutate(snapshot)
+    assert result == beanfile.entries.by_type(models.Open)
 
-    search.return_value = "test"
+    search.return_value = [3]
     mut = mutate.DirectivesMutator(search_expr="Home Depot")
-    result = mut.mutate(directives)
-    assert result == "test"
+    result = mut.mutate(snapshot)
+    assert result.__root__ == [beanfile.entries[3]]
     search.assert_called_once_with("Home Depot")
+
+
+def test_directives_filter(beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+    for expr in [
+        "[?ty == 'Transaction']",
+        "[?payee == 'Safeway' || ty == 'Note']",
+        "[?postings[?units.number < `0`]]",
+        "[?ty == 'Missing']",
+        "[?ty == 'Transaction'].merge(@, {flag: '!'})",
+    ]:
+        result = mutate.DirectivesMutator(filter_expr=expr).mutate(snapshot)
+        expected = beanfile.entries.filter(expr) or models.Directives(
+            __root__=[]
+        )
+        assert result.json() == expected.json()
+
+    # Directives selected as a whole are returned as they are
+    mut = mutate.DirectivesMutator(filter_expr="[?ty == 'Transaction']")
+    for result in mut.mutate(snapshot):
+        assert any(result is e for e in beanfile.entries)
+
+
+def test_directives_search_first(beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+    mut = mutate.DirectivesMutator(
+        filter_expr="[?ty == 'Transaction']",
+        search_expr="link1",
+        priority=mutate.MutatePriority.search,
+    )
+    assert [d.payee for d in mut.mutate(snapshot)] == [
+        "Home Depot",
+        "Safeway",
+        "Disneyland",
+    ]
+
+
+def test_directives_dates(beanfile: models.BeancountFile):
+    entries = beanfile.entries
+    for i, entry in enumerate(entries):
+        entry.date = date(2022, 1, 1) + timedelta(days=i)
+    snapshot = cache.Snapshot(beanfile)
+
+    def dates(mut: mutate.DirectivesMutator, positions=None) -> list[date]:
+        return [d.date for d in mut.mutate(snapshot, positions)]
+
+    start, end = date(2022, 1, 3), date(2022, 1, 6)
+    expected = [e.date for e in entries if start <= e.date < end]
+    assert dates(mutate.DirectivesMutator(start=start, end=end)) == expected
+    assert dates(mutate.DirectivesMutator(start=start)) == [
+        e.date for e in entries if start <= e.date
+    ]
+    assert dates(mutate.DirectivesMutator(end=end)) == [
+        e.date for e in entries if e.date < end
+    ]
+    assert dates(mutate.DirectivesMutator(start=start, end=end), [0, 3]) == [
+        entries[3].date
+    ]
+
+    # Directives which aren't sorted by date are returned in ledger order
+    entries.__root__.reverse()
+    snapshot = cache.Snapshot(beanfile)
+    expected = [e.date for e in entries if start <= e.date < end]
+    assert dates(mutate.DirectivesMutator(start=start, end=end)) == expected
+    pos = len(entries) - 4
+    assert dates(mutate.DirectivesMutator(start=start, end=end), [0, pos]) == [
+        entries[pos].date
+    ]
+
+
+def test_directives_pushdown(beanfile: models.BeancountFile):
+    entries = beanfile.entries
+    for i, entry in enumerate(entries):
+        entry.date = date(2022, 1, 1) + timedelta(days=i % 7)
+
+    exprs = [
+        '[?date > `"2022-01-03"`]',
+        "[?date >= '2022-01-03' && date < '2022-01-05']",
+        "[?'2022-01-03' == date]",
+        "[?date != '2022-01-03']",
+        "[?date <= '2022']",
+        "[?account == 'Assets:Bank:House']",
+        "[?payee == 'Safeway']",
+        "[?ty == 'Transaction' && date > '2022-01-02']",
+        "[?ty == 'Open' || payee == 'Safeway']",
+        "[?ty == 'Note' && contains(comment, 'test')]",
+        "[?ty == 'Transaction'].merge(@, {flag: '!'})",
+    ]
+    for sort in (False, True):
+        if sort:
+            entries.__root__.sort(key=lambda e: e.date)
+        snapshot = cache.Snapshot(beanfile)
+        assert (snapshot.indexes.chronological is None) == sort
+
+        for expr in exprs:
+            mut = mutate.DirectivesMutator(filter_expr=expr)
+            expected = entries.filter(expr) or models.Directives(__root__=[])
+            assert mut.mutate(snapshot).json() == expected.json(), expr
+
+            mut.start = date(2022, 1, 2)
+            expected = models.Directives(
+                __root__=[e for e in expected if e.date >= mut.start]
+            )
+            assert mut.mutate(snapshot).json() == expected.json(), expr
+
+
+@mock.patch("app.core.mutate._compile")
+def test_directives_pushdown_exact(compile, beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+    expr = "[?ty == 'Transaction' && payee == 'Safeway']"
+    compile.return_value = mock.Mock(parsed=jmespath.compile(expr).parsed)
+
+    result = mutate.DirectivesMutator(filter_expr="...").mutate(snapshot)
+    assert [d.payee for d in result] == ["Safeway"]
+    compile.return_value.search.assert_not_called()
+
+
+def test_directives_ranked(beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+
+    def payees(mut: mutate.DirectivesMutator) -> list[str]:
+        return [d.payee for d in mut.mutate(snapshot)]
+
+    mut = mutate.DirectivesMutator(
+        search_expr="saf",
+        search_mode=mutate.SearchMode.ranked,
+    )
+    assert payees(mut) == ["Safeway"]
+
+    mut.search_expr = "link1"
+    mut.filter_expr = "[?ty == 'Transaction']"
+    assert len(payees(mut)) == 3
+
+    # Shorter texts rank first, ties are broken by ledger order
+    mut.limit = 2
+    assert payees(mut) == ["Safeway", "Disneyland"]
+
+    mut.search_expr = "safewya"
+    assert payees(mut) == []
+    mut.search_mode = mutate.SearchMode.fuzzy
+    assert payees(mut) == ["Safeway"]
+
+    # Transformed directives are searched and limited as well
+    mut.search_expr = "link1"
+    mut.filter_expr = "[?ty == 'Transaction'].merge(@, {flag: '!'})"
+    assert payees(mut) == ["Safeway", "Disneyland"]
+
+    mut = mutate.DirectivesMutator(limit=3)
+    assert mut.mutate(snapshot).__root__ == beanfile.entries.__root__[:3]
+
+
+def test_directives_page(beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+    entries = beanfile.entries.__root__
+
+    def page(mut: mutate.DirectivesMutator) -> tuple[list, int | None]:
+        directives, after = mut.page(snapshot)
+        return directives.__root__, after
+
+    mut = mutate.DirectivesMutator(limit=3)
+    assert page(mut) == (entries[:3], 3)
+    mut.offset = 3
+    assert page(mut) == (entries[3:6], 6)
+    mut.offset = len(entries) - 1
+    assert page(mut) == (entries[-1:], None)
+    mut.limit = None
+    mut.offset = 2
+    assert page(mut) == (entries[2:], None)
+
+    # Pages of ranked results continue in the order of their rank
+    def payees(mut: mutate.DirectivesMutator) -> list[str]:
+        return [d.payee for d in mut.page(snapshot)[0]]
+
+    mut = mutate.DirectivesMutator(
+        search_expr="link1",
+        search_mode=mutate.SearchMode.ranked,
+        filter_expr="[?ty == 'Transaction']",
+        limit=2,
+    )
+    ranked = payees(dataclasses.replace(mut, limit=None))
+    first = payees(mut)
+    mut.offset = 2
+    assert first + payees(mut) == ranked
+
+
+def test_directives_fused(beanfile: models.BeancountFile):
+    snapshot = cache.Snapshot(beanfile)
+
+    # Selecting filters commute with searches, the priority doesn't matter
+    results = []
+    for priority in mutate.MutatePriority:
+        mut = mutate.DirectivesMutator(
+            filter_expr="[?contains(narration || '', 'o')]",
+            search_expr="link1",
+            priority=priority,
+        )
+        results.append([d.payee for d in mut.mutate(snapshot)])
+    assert results == [["Home Depot", "Disneyland"]] * 2
+
+    # The expression is only evaluated against the final intersection
+    expr = "[?ty == 'Transaction' && contains(narration, 'i')]"
+    with mock.patch("app.core.mutate._compile") as compile:
+        compile.return_value = mock.Mock(
+            parsed=jmespath.compile(expr).parsed,
+            search=mock.Mock(side_effect=lambda view: view),
+        )
+        mut = mutate.DirectivesMutator(filter_expr=expr, search_expr="milk")
+        assert [d.payee for d in mut.mutate(snapshot)] == ["Safeway"]
+        (view,), _ = compile.return_value.search.call_args
+        assert [v["payee"] for v in view] == ["Safeway"]
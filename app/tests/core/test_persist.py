@@ -0,0 +1,46 @@
+from app.core import cache, persist
+from app.core.sources import Sources
+
+
+def test_store(tmp_path, beanfile):
+    main = tmp_path / "main.beancount"
+    main.write_text("2022-01-01 open Assets:Bank\n")
+
+    store = persist.SnapshotStore(str(tmp_path / ".bapi.snapshot"))
+    assert store.read() is None
+
+    store.write(cache.Snapshot(beanfile, 3), Sources([str(main)]))
+    restored = store.read()
+    assert restored is not None
+
+    snapshot, sources = restored
+    assert snapshot.beanfile == beanfile
+    assert snapshot.generation == 3
+    assert sources.paths == [str(main)]
+
+    # Changing a source file invalidates the snapshot
+    main.write_text("2022-01-01 open Assets:Cash\n")
+    assert store.read() is None
+
+    # As does a new file matching an include pattern
+    main.write_text('include "*.txns"\n')
+    store.write(cache.Snapshot(beanfile), Sources([str(main)]))
+    assert store.read() is not None
+    (tmp_path / "2022.txns").write_text("")
+    assert store.read() is None
+
+
+def test_store_format(tmp_path, beanfile):
+    main = tmp_path / "main.beancount"
+    main.write_text("")
+
+    path = tmp_path / ".bapi.snapshot"
+    store = persist.SnapshotStore(str(path))
+    store.write(cache.Snapshot(beanfile), Sources([str(main)]))
+
+    data = path.read_bytes()
+    path.write_bytes(b"XXXX" + data[4:])
+    assert store.read() is None
+
+    path.write_bytes(data[:3])
+    assert store.read() is None
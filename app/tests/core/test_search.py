@@ -1,7 +1,8 @@
 from datetime import date
+from unittest import mock
 
 import pytest
-from app.core import search
+from app.core import beancount, search
 from bdantic import models
 
 
@@ -10,8 +11,13 @@ def test_index_entry():
     fts._index_entry(1, "some words", "data")
 
     assert fts._entries[1] == "data"
-    assert fts._index["some"] == {1}
-    assert fts._index["words"] == {1}
+    assert list(fts._index["some"]) == [1]
+    assert list(fts._index["words"]) == [1]
+
+    # Posting lists stay sorted and free of duplicates
+    fts._index_entry(0, "some some", "data0")
+    fts._index_entry(1, "some", "data")
+    assert list(fts._index["some"]) == [0, 1]
 
 
 def test_search():
@@ -32,7 +38,10 @@ def test_search():
     assert fts.search("more words") == expected
 
     expected = ["data3"]
-    assert fts.search("something else")
+    assert fts.search("something else") == expected
+
+    assert fts.search("words missing") == []
+    assert fts.search("") == []
 
 
 @pytest.mark.parametrize(
@@ -224,3 +233,84 @@ def test_search_directives():
     assert fts.search("link1") == d
     assert fts.search("tag1") == d
     assert fts.search("Bought some more things") == e
+
+
+def test_search_positions(entries: models.Directives):
+    entries.__root__.insert(
+        0,
+        models.Custom(
+            id="", date=date.today(), meta=None, type="test", values=[]
+        ),
+    )
+    searcher = search.DirectiveSearcher(entries)
+
+    positions = searcher.positions("link1")
+    assert positions == sorted(positions)
+    assert [entries[p] for p in positions] == [
+        e for e in entries if "link1" in (getattr(e, "links", None) or ())
+    ]
+    assert searcher.positions("Safeway") == [
+        i
+        for i, e in enumerate(entries)
+        if getattr(e, "payee", "") == "Safeway"
+    ]
+
+    # The index is only built once
+    assert searcher.fts is searcher.fts
+    assert searcher.positions(" ") == []
+
+
+@mock.patch.object(beancount, "_shared", beancount.ModelCache())
+def test_search_lazy():
+    ledger = """
+2022-01-01 open Assets:Bank USD
+2022-01-02 note Assets:Bank "Called the bank"
+2022-01-05 * "Safeway" "Milk" #food
+  Assets:Bank   -2.99 USD
+  Expenses:Food
+"""
+    lazy = beancount.from_string(ledger, lazy=True)
+    expected = beancount.from_string(ledger)
+
+    searcher = search.DirectiveSearcher(lazy.entries)
+    assert searcher.positions("Assets:Bank") == [0, 1]
+    assert searcher.rank("safeway") == search.DirectiveSearcher(
+        expected.entries
+    ).rank("safeway")
+    assert lazy.entries.__root__.materialized == 0
+
+    # Only the found directives are converted
+    assert searcher.search("food").__root__ == [expected.entries[2]]
+    assert lazy.entries.__root__.materialized == 1
+
+
+def test_rank():
+    index = [
+        ("home depot", "data0"),
+        ("home improvement store", "data1"),
+        ("homeowners association fees", "data2"),
+        ("grocery store", "data3"),
+    ]
+    fts = search.FullTextSearch(index)
+
+    # Exact matches score higher than prefix matches
+    ranks = fts.rank("home")
+    assert set(ranks) == {0, 1, 2}
+    assert ranks[0] > ranks[2] and ranks[1] > ranks[2]
+
+    # Shorter texts score higher for the same match
+    assert ranks[0] > ranks[1]
+
+    # All query tokens must match
+    assert set(fts.rank("home sto")) == {1}
+    assert fts.rank("home grocery") == {}
+    assert fts.rank("") == {}
+
+    # Misspelled tokens only match when fuzzy
+    assert fts.rank("depto") == {}
+    assert set(fts.rank("depto", fuzzy=True)) == {0}
+    assert set(fts.rank("groceyr stor", fuzzy=True)) == {3}
+
+
+def test_trigrams():
+    assert search._trigrams("cat") == {"  c", " ca", "cat", "at "}
@@ -0,0 +1,57 @@
+import os
+
+from app.core import sources
+
+
+def test_changed(tmp_path):
+    main = tmp_path / "main.beancount"
+    other = tmp_path / "other.beancount"
+    main.write_text('include "other.beancount"\n')
+    other.write_text("2022-01-01 open Assets:Bank\n")
+
+    srcs = sources.Sources([str(main), str(other), str(main)])
+    assert srcs.paths == sorted([str(main), str(other)])
+    assert not srcs.changed()
+
+    # Touching a file without changing its contents is not a change
+    st = os.stat(other)
+    os.utime(other, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert not srcs.changed()
+
+    other.write_text("2022-01-01 open Assets:Cash\n")
+    assert srcs.changed()
+    assert not srcs.changed()
+
+    other.unlink()
+    assert srcs.changed()
+
+
+def test_changed_glob(tmp_path):
+    main = tmp_path / "main.beancount"
+    main.write_text('include "txns/*.beancount"\n')
+    (tmp_path / "txns").mkdir()
+    first = tmp_path / "txns" / "2021.beancount"
+    first.write_text("")
+
+    srcs = sources.Sources([str(main), str(first)])
+    assert srcs.patterns == [str(tmp_path / "txns" / "*.beancount")]
+    assert not srcs.changed()
+
+    # A new file matching an include pattern is a change
+    (tmp_path / "txns" / "2022.beancount").write_text("")
+    assert srcs.changed()
+    assert not srcs.changed()
+
+    (tmp_path / "txns" / "2022.txt").write_text("")
+    assert not srcs.changed()
+
+
+def test_digest(tmp_path):
+    main = tmp_path / "main.beancount"
+    main.write_text("2022-01-01 open Assets:Bank\n")
+
+    first = sources.Sources([str(main)]).digest()
+    assert sources.Sources([str(main)]).digest() == first
+
+    main.write_text("2022-01-01 open Assets:Cash\n")
+    assert sources.Sources([str(main)]).digest() != first
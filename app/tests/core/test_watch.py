@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+import pytest
+from app.core import watch
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_wait(tmp_path):
+    main = tmp_path / "main.beancount"
+    main.write_text("")
+    (tmp_path / "other.txt").write_text("")
+
+    watcher = watch.Watcher([str(main)], debounce=0.05)
+    try:
+        # Unrelated files in the same directory are ignored
+        (tmp_path / "other.txt").write_text("changed")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(watcher.wait(), 0.2)
+
+        # A burst of writes results in a single change
+        for i in range(5):
+            main.write_text(f"write {i}")
+        await asyncio.wait_for(watcher.wait(), 1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(watcher.wait(), 0.2)
+
+        # Editors which save by renaming a temporary file
+        tmp = tmp_path / ".main.beancount.swp"
+        tmp.write_text("renamed")
+        os.rename(tmp, main)
+        await asyncio.wait_for(watcher.wait(), 1)
+    finally:
+        watcher.close()
+
+
+@pytest.mark.anyio
+async def test_wait_patterns(tmp_path):
+    main = tmp_path / "main.beancount"
+    main.write_text("")
+    txns = tmp_path / "txns"
+    txns.mkdir()
+
+    watcher = watch.Watcher(
+        [str(main)],
+        debounce=0.05,
+        patterns=[str(txns / "*.beancount"), str(tmp_path / "**/*.txns")],
+    )
+    try:
+        # Files not matching the patterns are ignored, whatever their name
+        (txns / "2022.txt").write_text("")
+        (txns / os.fsdecode(b"\xff.txt")).write_text("")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(watcher.wait(), 0.2)
+
+        (txns / "2022.beancount").write_text("")
+        await asyncio.wait_for(watcher.wait(), 1)
+
+        (tmp_path / "2022.txns").write_text("")
+        await asyncio.wait_for(watcher.wait(), 1)
+    finally:
+        watcher.close()
@@ -0,0 +1,99 @@
+"""Benchmarks the full-text search index against the previous set based one.
+
+Builds both indexes over a synthetic corpus and reports the memory used by
+each index along with the latency of queries combining tokens of different
+frequencies.
+
+Usage: python scripts/bench_search.py [number of entries]
+"""
+import random
+import sys
+import timeit
+import tracemalloc
+from typing import Any
+
+from app.core.search import FullTextSearch
+
+
+class SetSearch(FullTextSearch):
+    """The previous index which stored a set of entry IDs per token."""
+
+    _index: dict[str, set[int]]  # type: ignore[assignment]
+
+    def ids(self, query: str) -> list[int]:
+        tokens = self._tokenize(query)
+        indexes = [self._index.get(token, set()) for token in tokens]
+        return list(set.intersection(*indexes))
+
+    def _index_entry(self, entry_id: int, text: str, entry: Any):
+        if entry_id not in self._entries:
+            self._entries[entry_id] = entry
+
+        for token in self._tokenize(text):
+            if token not in self._index:
+                self._index[token] = set()
+            self._index[token].add(entry_id)
+
+
+def corpus(size: int) -> list[tuple[str, int]]:
+    """Generates entries with word frequencies roughly following Zipf's law.
+
+    Args:
+        size: The number of entries to generate.
+
+    Returns:
+        A list of (text, entry) tuples.
+    """
+    rng = random.Random(42)
+    words = [f"word{i}" for i in range(5000)]
+    weights = [1 / (i + 1) for i in range(len(words))]
+
+    return [
+        (" ".join(rng.choices(words, weights, k=8)), i) for i in range(size)
+    ]
+
+
+def build(cls: type[FullTextSearch], data: list) -> tuple[FullTextSearch, int]:
+    """Builds an index and measures the memory it allocated.
+
+    Args:
+        cls: The index implementation.
+        data: The entries to index.
+
+    Returns:
+        A tuple of the index and the number of bytes allocated.
+    """
+    tracemalloc.start()
+    fts = cls(data)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return fts, size
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    data = corpus(size)
+    queries = {
+        "frequent": "word0",
+        "frequent pair": "word0 word1",
+        "frequent + rare": "word0 word1 word2500",
+        "rare pair": "word2500 word4000",
+    }
+
+    print(f"{size} entries")
+    for cls in (SetSearch, FullTextSearch):
+        fts, allocated = build(cls, data)
+        print(f"\n{cls.__name__}: {allocated / 2**20:.1f} MiB")
+        for name, query in queries.items():
+            runs = 20
+            elapsed = timeit.timeit(lambda: fts.search(query), number=runs)
+            count = len(fts.search(query))
+            print(
+                f"  {name:<16} {elapsed / runs * 1000:8.2f} ms"
+                f" ({count} results)"
+            )
+
+
+if __name__ == "__main__":
+    main()